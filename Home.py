@@ -1,7 +1,5 @@
-import pandas as pd
 import streamlit as st
-from shapely.geometry import Point, Polygon
-import fetch as f
+import dataset
 
 st.set_page_config(
     page_title="HDB Resale Price Dashboard",
@@ -14,93 +12,8 @@ st.set_page_config(
         }
     )
 
-@st.cache_data(show_spinner=False, max_entries=1, ttl=2_630_000)  # dataset is updated monthly
-def load_data():
-    df_web = f.get_data()
-    df_stored = pd.read_parquet("./assets/dataset.parquet")
-    df = pd.concat([df_web, df_stored], axis=0)
-    hdb_coordinates = f.get_coords_df()
-    geo_df = f.get_chloropeth()
-    return df, hdb_coordinates, geo_df
-
-with st.spinner("Fetching data..."):
-    df, hdb_coordinates, geo_df = load_data()
-
-if "geo_df" not in st.session_state:
-        st.session_state.geo_df = geo_df
-
-if "df_raw" not in st.session_state:
-    st.session_state.df_raw = df.head(10).copy()
-
-@st.cache_data(show_spinner=False)
-def get_planning_areas():
-    planning_areas = []
-    polygons = []
-    for i in range(len(st.session_state.geo_df["features"])):
-        planning_areas.append(
-            st.session_state.geo_df["features"][i]["properties"]["PLN_AREA_N"]
-        )
-        try:
-            polygons.append(
-                Polygon(
-                    st.session_state.geo_df["features"][i]["geometry"]["coordinates"][0]
-                )
-            )
-        except:
-            polygons.append(
-                Polygon(
-                    st.session_state.geo_df["features"][i]["geometry"]["coordinates"][
-                        0
-                    ][0]
-                )
-            )
-    return planning_areas, polygons
-
-planning_areas, polygons = get_planning_areas()
-
-@st.cache_data(show_spinner=False)
-def generate_point(coordinates):
-    return Point(coordinates[1], coordinates[0])
-
-def check_polygons(point):
-    for index, area in enumerate(polygons):
-        if area.contains(point):
-            return planning_areas[index]
-
-@st.cache_data(show_spinner=False)
-def find_unique_locations(dataframe) -> dict:
-    town_map = {}
-    for address in dataframe["address"].unique():
-        point = generate_point(list(hdb_coordinates.loc[address]))
-        town_map[address] = check_polygons(point)
-    return town_map
-
-
-@st.cache_data(ttl=2_630_000, show_spinner="Transforming data...")
-def transform_data(df):
-    df["address"] = df["block"] + " " + df["street_name"]
-    df_merged = df.merge(hdb_coordinates, how="left", on="address")
-    df_merged.rename(columns={"month": "date"}, inplace=True)
-    df_merged["date"] = pd.to_datetime(df_merged["date"], format="%Y-%m", errors="raise")
-    df_merged["year"] = df_merged.date.dt.year
-    df_merged["remaining_lease"] = df_merged["lease_commence_date"].astype(int) + 99 - df_merged["date"].dt.year
-    df_merged = df_merged.rename(columns={'town': 'town_original'})
-    town_map = find_unique_locations(df_merged)
-    df_merged["town"] = df_merged["address"].map(town_map)
-    df_merged["price_per_sqm"] = df_merged["resale_price"].astype(float) / df_merged["floor_area_sqm"].astype(float)
-    # changing dtypes to reduce space when storing in session_state
-    df_merged[["town_original", "flat_type", "flat_model", "storey_range", "town", "address", "year"]] = (df_merged[["town_original", "flat_type", "flat_model", "storey_range", "town", "address", "year"]]
-                                                                                                            .astype("category"))
-    df_merged["resale_price"] = df_merged["resale_price"].astype(float).astype("int32")
-    df_merged[["latitude", "longitude"]] = df_merged[["latitude", "longitude"]].astype("float32")
-    df_merged[["floor_area_sqm", "remaining_lease"]] = df_merged[["floor_area_sqm", "remaining_lease"]].astype(float).astype("int16")
-    df_merged["price_per_sqm"] = df_merged["price_per_sqm"].astype("float16")
-    columns = ['town', 'flat_type', 'flat_model', 'floor_area_sqm', 'price_per_sqm', 'date', 'year', 'remaining_lease', 'lease_commence_date', 'storey_range', 'address', 'latitude', 'longitude', 'resale_price']
-    df_merged = df_merged.loc[:, columns]
-    return df_merged
-
-if "df" not in st.session_state:
-    st.session_state.df = transform_data(df)
+# load the shared dataset up front, so the other pages open straight away
+dataset.get_dataset()
 
 with st.sidebar:
     st.markdown(
@@ -112,6 +25,7 @@ with st.sidebar:
         - Check out my other projects on [**GitHub**](https://github.com/eeshawn11/)
         """
         )
+    st.caption(dataset.refresh_summary())
 
 with st.container():
     st.title("Singapore HDB Resale Price from 2000")
@@ -0,0 +1,173 @@
+import time
+from dataclasses import dataclass
+import numpy as np
+import pandas as pd
+import indexes
+import sketch
+
+"""
+Pre-aggregated town x month x flat_type cube, built once per dataset version so the
+Visuals page can roll up a few thousand cells instead of scanning every transaction.
+"""
+
+cube_keys = ["town", "date", "flat_type"]
+# median resale price as of Jan 2020, the 100 of the price index
+index_benchmark = 400000
+
+
+@dataclass(frozen=True)
+class Cube:
+    """
+    `cells` holds one row per (town, date, flat_type) with count, sum, min and max of
+    resale_price. `price_sketch` and `lease_counts` are long tables of (cell, value, count):
+    mergeable resale price sketches (see sketch.py), and exact remaining lease years.
+    """
+    cells: pd.DataFrame
+    price_sketch: pd.DataFrame
+    lease_counts: pd.DataFrame
+
+
+def build_cube(df: pd.DataFrame) -> Cube:
+    grouped = df.groupby(cube_keys, observed=True, dropna=False, sort=True)
+    cells = grouped["resale_price"].agg(["count", "sum", "min", "max"]).reset_index()
+    cells["year"] = cells["date"].dt.year
+    cell_ids = grouped.ngroup().to_numpy()
+    return Cube(
+        cells=cells,
+        price_sketch=sketch.build_sketches(cell_ids, df["resale_price"]),
+        lease_counts=sketch.count_values(cell_ids, df["remaining_lease"].to_numpy()),
+    )
+
+
+def select_cells(cube: Cube, town: str = None, years: list = None) -> np.ndarray:
+    """
+    Boolean mask over the cube's cells for one town (all towns if None) and a list of years.
+    """
+    mask = np.ones(len(cube.cells), dtype=bool)
+    if town is not None:
+        mask &= (cube.cells["town"] == town).to_numpy()
+    if years is not None:
+        mask &= cube.cells["year"].isin(years).to_numpy()
+    return mask
+
+
+def rollup(cube: Cube, by, mask: np.ndarray = None, exact_rows: pd.DataFrame = None) -> pd.DataFrame:
+    """
+    Roll the selected cells up to one row per value of `by` ("town", "date", "flat_type",
+    "year", a list of these, or None for a single total), with transaction count, total,
+    min, max and median resale price, and the median remaining lease.
+
+    Medians are merged from the cube's sketches, unless the matching transactions are passed
+    as `exact_rows`, in which case they are computed exactly from those rows for auditing.
+    """
+    cells = cube.cells if mask is None else cube.cells[mask]
+    grouped = cells.groupby(by if by is not None else np.zeros(len(cells), dtype=int), observed=True, sort=True)
+    result = grouped.agg(
+        transactions=("count", "sum"),
+        resale_price_sum=("sum", "sum"),
+        resale_price_min=("min", "min"),
+        resale_price_max=("max", "max"),
+    )
+    if exact_rows is not None:
+        exact_by = by if by is not None else np.zeros(len(exact_rows), dtype=int)
+        if by == "year":
+            exact_by = exact_rows["date"].dt.year.rename("year")
+        medians = exact_rows.groupby(exact_by, observed=True)[["resale_price", "remaining_lease"]].median()
+        result = result.join(medians)
+    else:
+        cell_groups = np.full(len(cube.cells), -1)
+        cell_groups[cells.index.to_numpy()] = grouped.ngroup().fillna(-1).astype(int).to_numpy()
+        result["resale_price"] = sketch.grouped_quantile(cube.price_sketch, cell_groups, len(result), 0.5, sketch.bucket_value)
+        result["remaining_lease"] = sketch.grouped_quantile(cube.lease_counts, cell_groups, len(result), 0.5)
+    return result.reset_index(drop=by is None)
+
+
+def period_stats(row) -> dict:
+    return {
+        "count": int(row["transactions"]),
+        "sum": int(row["resale_price_sum"]),
+        "min": int(row["resale_price_min"]),
+        "max": int(row["resale_price_max"]),
+        "median": int(round(row["resale_price"])),
+    }
+
+
+def key_metrics(cube: Cube, town: str = None, year: int = None, get_rows=None) -> dict:
+    """
+    Count, total, min, max and median resale price for the selected period and, when a year
+    is selected, the year before it, from a single roll-up of the cube.
+
+    Passing `get_rows(town, year)` returning the matching transactions switches the medians
+    to exact values. Returns the "current" and "previous" stats (previous is None without a
+    prior year of data), their "delta", and the "seconds" taken.
+    """
+    start = time.perf_counter()
+    if year is None:
+        exact_rows = get_rows(town, None) if get_rows is not None else None
+        totals = rollup(cube, None, select_cells(cube, town), exact_rows)
+        current = period_stats(totals.iloc[0]) if len(totals) else None
+        previous = None
+    else:
+        exact_rows = None
+        if get_rows is not None:
+            exact_rows = pd.concat([get_rows(town, year - 1), get_rows(town, year)])
+        by_year = rollup(cube, "year", select_cells(cube, town, [year - 1, year]), exact_rows).set_index("year")
+        current = period_stats(by_year.loc[year]) if year in by_year.index else None
+        previous = period_stats(by_year.loc[year - 1]) if year - 1 in by_year.index else None
+    delta = None
+    if current is not None and previous is not None:
+        delta = {stat: current[stat] - previous[stat] for stat in current}
+    return {
+        "current": current,
+        "previous": previous,
+        "delta": delta,
+        "seconds": time.perf_counter() - start,
+    }
+
+
+@dataclass(frozen=True)
+class PeriodViews:
+    """
+    What the Visuals page shows for one selection: the matching transactions, the key
+    metrics, per-town and per-month roll-ups, and the transactions at or above the price
+    threshold.
+    """
+    df_filtered: pd.DataFrame
+    metrics: dict
+    choropleth_df: pd.DataFrame
+    flats_df: pd.DataFrame
+    resale_transactions_df: pd.DataFrame
+
+
+def period_views(data, town: str = None, year: int = None, threshold: int = 1_000_000, exact_medians: bool = False) -> PeriodViews:
+    """
+    Filter and aggregate `data` (a dataset.Dataset) for the selected town and year, either of
+    which may be None for all. Filters resolve to row positions through the filter index, and
+    town and monthly figures are rolled up from the cube, with medians merged from its
+    sketches unless `exact_medians` is set.
+    """
+    def get_filtered(town: str, year: int) -> pd.DataFrame:
+        return data.df.iloc[indexes.filter_rows(data.filter_index, town, year)]
+
+    df_filtered = get_filtered(town, year)
+    # key metrics for the period and the year before, with deltas, in one roll-up of the cube
+    metrics = key_metrics(data.cube, town, year, get_filtered if exact_medians else None)
+
+    cube_mask = select_cells(data.cube, town, None if year is None else [year])
+    exact_rows = df_filtered if exact_medians else None
+    choropleth_df = rollup(data.cube, "town", cube_mask, exact_rows)[["town", "transactions", "resale_price", "remaining_lease"]]
+    choropleth_df["resale_price"] = choropleth_df["resale_price"].round(0)
+    choropleth_df["age"] = 99 - choropleth_df["remaining_lease"]
+    # a binary search into the price index rather than a scan of the filtered rows
+    flats_rows = indexes.rows_above(data.price_index, threshold, town, year)
+    flats_df = data.df.iloc[flats_rows][["date", "resale_price", "floor_area_sqm", "town", "latitude", "longitude", "address", "flat_type"]]
+    resale_transactions_df = rollup(data.cube, "date", cube_mask, exact_rows)[["date", "transactions", "resale_price"]].rename(columns={"transactions": "town"})
+    resale_transactions_df["price_index"] = resale_transactions_df["resale_price"] / index_benchmark * 100
+    resale_transactions_df[["resale_price", "price_index"]] = resale_transactions_df[["resale_price", "price_index"]].round(0).astype("int32")
+    return PeriodViews(
+        df_filtered=df_filtered,
+        metrics=metrics,
+        choropleth_df=choropleth_df,
+        flats_df=flats_df,
+        resale_transactions_df=resale_transactions_df,
+    )
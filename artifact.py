@@ -0,0 +1,229 @@
+import fcntl
+import json
+import os
+import shutil
+import time
+from dataclasses import fields, is_dataclass
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+"""
+Ready-to-serve builds of the dataset, published offline by `python build.py dataset` (or by
+the first app process to need one) and memory-mapped by every app process instead of each
+fetching and transforming its own copy.
+
+Every frame and array of the dataset, including its cube, indexes and histograms, is
+stored as an uncompressed single-chunk Feather (Arrow IPC) file, so reading it maps the
+file rather than copying it, and processes mapping the same files share their pages.
+A manifest records how the files fit back together, along with any small values.
+
+Each version is written to its own directory and renamed into place when complete, then
+published by atomically replacing the `current.json` pointer, so readers only ever see
+whole versions and pick up a new one by re-reading the pointer. The pointer also records
+the format of the files, so checking a version can be attached only reads the pointer. Background refreshes
+coordinate through a lock file and record their outcome in `refresh.json`.
+"""
+
+path = os.path.dirname(__file__)
+artifact_dir = os.path.join(path, "assets", "dataset")
+pointer_path = os.path.join(artifact_dir, "current.json")
+# published versions kept on disk, older ones are removed when a new version is published
+keep_versions = 2
+status_path = os.path.join(artifact_dir, "refresh.json")
+lock_path = os.path.join(artifact_dir, "refresh.lock")
+
+
+def version_dir(version: str) -> str:
+    return os.path.join(artifact_dir, version)
+
+
+def write_table(directory: str, name: str, df: pd.DataFrame):
+    # one record batch keeps columns contiguous, so they convert to pandas without a copy
+    feather.write_feather(df, os.path.join(directory, name + ".arrow"), compression="uncompressed", chunksize=max(len(df), 1))
+
+
+def read_table(directory: str, name: str) -> pd.DataFrame:
+    table = feather.read_table(os.path.join(directory, name + ".arrow"), memory_map=True)
+    return table.to_pandas(split_blocks=True)
+
+
+def write_value(directory: str, name: str, value):
+    """
+    Store a value under `name` and return its manifest entry: dataclasses field by field,
+    frames and arrays as tables, dicts of arrays as one concatenated array with offsets,
+    and anything else inline as JSON.
+    """
+    if is_dataclass(value):
+        return {
+            "kind": "dataclass",
+            "fields": {field.name: write_value(directory, f"{name}.{field.name}", getattr(value, field.name)) for field in fields(value)},
+        }
+    if isinstance(value, pd.DataFrame):
+        write_table(directory, name, value)
+        return {"kind": "frame"}
+    if isinstance(value, np.ndarray):
+        write_table(directory, name, pd.DataFrame({"value": value}))
+        return {"kind": "array"}
+    if isinstance(value, pd.Index):
+        return {"kind": "index", "value": value.tolist()}
+    if isinstance(value, dict) and value and all(isinstance(v, np.ndarray) for v in value.values()):
+        lengths = [len(v) for v in value.values()]
+        write_table(directory, name, pd.DataFrame({"value": np.concatenate(list(value.values()))}))
+        return {"kind": "arrays", "keys": list(value), "offsets": np.cumsum([0] + lengths).tolist()}
+    if isinstance(value, np.integer):
+        value = int(value)
+    return {"kind": "json", "value": value}
+
+
+def read_value(directory: str, name: str, entry: dict, cls=None):
+    kind = entry["kind"]
+    if kind == "dataclass":
+        types = {field.name: field.type for field in fields(cls)}
+        return cls(**{
+            field: read_value(directory, f"{name}.{field}", field_entry, types[field])
+            for field, field_entry in entry["fields"].items()
+        })
+    if kind == "frame":
+        return read_table(directory, name)
+    if kind == "array":
+        return read_table(directory, name)["value"].to_numpy()
+    if kind == "index":
+        return pd.Index(entry["value"])
+    if kind == "arrays":
+        values = read_table(directory, name)["value"].to_numpy()
+        offsets = entry["offsets"]
+        return {key: values[offsets[i]:offsets[i + 1]] for i, key in enumerate(entry["keys"])}
+    return entry["value"]
+
+
+def write_artifact(data, format_version: str) -> dict:
+    """
+    Write `data` (a dataset.Dataset) as a new version and publish it. Rebuilding a version
+    that is already on disk only publishes it again. `format_version` identifies the layout
+    of the files, recorded in the pointer and checked by `is_compatible` before a version is attached.
+    """
+    os.makedirs(artifact_dir, exist_ok=True)
+    manifest = {
+        "version": data.version,
+        "built": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "rows": int(len(data.df)),
+        "format": format_version,
+        "pyarrow": pa.__version__,
+    }
+    target_dir = version_dir(data.version)
+    if not os.path.exists(target_dir):
+        tmp_dir = f"{target_dir}.tmp-{os.getpid()}"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        manifest["dataset"] = write_value(tmp_dir, "dataset", data)
+        with open(os.path.join(tmp_dir, "manifest.json"), "w") as file:
+            json.dump(manifest, file)
+        try:
+            os.rename(tmp_dir, target_dir)
+        except OSError:
+            # another process published the same version first
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    publish(data.version, format_version)
+    return manifest
+
+
+def publish(version: str, format_version: str):
+    tmp_path = f"{pointer_path}.tmp-{os.getpid()}"
+    with open(tmp_path, "w") as file:
+        json.dump({"version": version, "published": time.time(), "format": format_version, "pyarrow": pa.__version__}, file)
+    os.replace(tmp_path, pointer_path)
+    prune(version)
+
+
+def prune(current: str):
+    """
+    Remove all but the newest `keep_versions` versions. Processes still mapping a removed
+    version keep reading it until they move on, as the files are only unlinked.
+    """
+    versions = [
+        entry for entry in os.scandir(artifact_dir)
+        if entry.is_dir() and ".tmp-" not in entry.name and entry.name != current
+    ]
+    versions.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+    for entry in versions[keep_versions - 1:]:
+        shutil.rmtree(entry.path, ignore_errors=True)
+
+
+def read_pointer() -> dict:
+    """
+    The published version, when it was published and its format, or None if nothing is published.
+    """
+    try:
+        with open(pointer_path) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
+
+
+def read_manifest(version: str) -> dict:
+    with open(os.path.join(version_dir(version), "manifest.json")) as file:
+        return json.load(file)
+
+
+def is_compatible(pointer: dict, format_version: str) -> bool:
+    """
+    Whether the published version of `pointer` was written in `format_version` by this
+    pyarrow version, and so can be attached by this build of the app.
+    """
+    if pointer is None:
+        return False
+    return pointer.get("format") == format_version and pointer.get("pyarrow") == pa.__version__
+
+
+def read_artifact(cls, version: str):
+    """
+    Memory-map a published version back into an instance of `cls` (dataset.Dataset).
+    The frames are backed by the read-only mapped files.
+    """
+    manifest = read_manifest(version)
+    return read_value(version_dir(version), "dataset", manifest["dataset"], cls)
+
+
+def acquire_lock():
+    """
+    Take the refresh lock shared by all processes, returning the open lock file to pass to
+    `release_lock`, or None if another process holds it. The lock is an `flock` on the file,
+    so the system releases it if the holder dies mid-build. The file itself is never removed.
+    """
+    os.makedirs(artifact_dir, exist_ok=True)
+    lock = open(lock_path, "a+")
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock.close()
+        return None
+    # the pid is only for inspection, the flock alone decides who holds the lock
+    lock.truncate(0)
+    lock.write(str(os.getpid()))
+    lock.flush()
+    return lock
+
+
+def release_lock(lock):
+    fcntl.flock(lock, fcntl.LOCK_UN)
+    lock.close()
+
+
+def write_status(status: dict):
+    tmp_path = f"{status_path}.tmp-{os.getpid()}"
+    with open(tmp_path, "w") as file:
+        json.dump(status, file)
+    os.replace(tmp_path, status_path)
+
+
+def read_status() -> dict:
+    """
+    Start, finish, outcome and message of the last refresh attempt, or None before the first.
+    """
+    try:
+        with open(status_path) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
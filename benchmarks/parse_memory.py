@@ -0,0 +1,70 @@
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import fetch as f
+import replay_server
+
+"""
+Compares peak memory of parsing a datastore_search response with `.json()` and a
+list of record dicts against the streaming column parser in fetch.parse_stream.
+
+    python benchmarks/parse_memory.py --rows 200000
+"""
+
+
+def make_body(rows: int) -> bytes:
+    records = replay_server.synthetic_records(rows)
+    body = {"help": "", "success": True, "result": {"resource_id": "bench", "records": records, "total": rows}}
+    return json.dumps(body).encode("utf-8")
+
+
+def parse_json(body: bytes) -> pd.DataFrame:
+    response = json.loads(body)
+    return pd.DataFrame(response["result"]["records"])
+
+
+def parse_streaming(body: bytes) -> pd.DataFrame:
+    chunk_size = 1 << 16
+    chunks = (body[i:i + chunk_size].decode("utf-8") for i in range(0, len(body), chunk_size))
+    _, columns = f.parse_stream(chunks)
+    return pd.DataFrame(columns)
+
+
+def measure(parser, body: bytes) -> dict:
+    tracemalloc.start()
+    start = time.perf_counter()
+    df = parser(body)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "seconds": elapsed,
+        "peak_mb": peak / 1e6,
+        "frame_mb": df.memory_usage(deep=True).sum() / 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Peak memory of response parsing")
+    parser.add_argument("--rows", type=int, default=200_000)
+    args = parser.parse_args()
+
+    body = make_body(args.rows)
+    print(f"Response body: {len(body) / 1e6:,.1f} MB, {args.rows:,} records")
+    for name, fn in [("json + DataFrame(records)", parse_json), ("parse_stream", parse_streaming)]:
+        result = measure(fn, body)
+        print(
+            f"{name:<28} peak {result['peak_mb']:>8,.1f} MB"
+            f"  frame {result['frame_mb']:>8,.1f} MB"
+            f"  {result['seconds']:>6.2f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
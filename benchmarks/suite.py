@@ -0,0 +1,401 @@
+import argparse
+import contextlib
+import glob
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import aggregates
+import charts
+import dataset
+import fetch as f
+import geo
+import histograms
+import indexes
+import replay_server
+import store
+import synthetic
+
+"""
+Times and memory-profiles each stage of the fetch -> transform -> render pipeline on fixed,
+seeded synthetic inputs: response parsing, fetching through a local replay server, the
+transform, the spatial join, the derived indexes, the Visuals filter and aggregation block,
+and building and serializing every chart.
+
+Each run is saved under benchmarks/results/ by commit and compared against the previous
+saved run on the same inputs, with percentage deltas and regressions flagged.
+
+    python benchmarks/suite.py run --rows 200000
+    python benchmarks/suite.py run --rows 10000000 --start-year 1990 --filter dataset.
+    python benchmarks/suite.py run --snapshot-dir assets/synthetic --filter dataset.
+    python benchmarks/suite.py run --filter figure.
+    python benchmarks/suite.py compare 3f989ee e6b112e
+"""
+
+path = os.path.dirname(__file__)
+results_dir = os.path.join(path, "results")
+registry = {}
+
+
+def benchmark(name: str):
+    """
+    Register a benchmark. The decorated generator does any setup from the shared inputs,
+    yields the zero-argument callable that is timed, and cleans up once it resumes.
+    """
+    def register(setup):
+        registry[name] = contextlib.contextmanager(setup)
+        return setup
+    return register
+
+
+class Inputs:
+    """
+    Fixed inputs shared by the benchmarks, built lazily so a filtered run only pays for what it uses.
+    """
+
+    def __init__(self, rows: int, start_year: int, snapshot_dir: str = None):
+        self.start_year = start_year
+        self.snapshot_dir = snapshot_dir
+        self.cache = {}
+        if snapshot_dir:
+            partitions = store.read_manifest(snapshot_dir)["partitions"]
+            self.years = [year for year in partitions if int(year) >= start_year]
+            rows = sum(partitions[year]["rows"] for year in self.years)
+        self.rows = rows
+
+    def get(self, name: str):
+        if name not in self.cache:
+            self.cache[name] = getattr(self, "make_" + name)()
+        return self.cache[name]
+
+    def make_records(self) -> list:
+        return synthetic.to_records(self.get("transactions"))
+
+    def make_transactions(self) -> pd.DataFrame:
+        if self.snapshot_dir:
+            # a snapshot from synthetic.py, read as the app reads its own
+            categories = dataset.raw_categories + ["remaining_lease"]
+            return store.read_snapshot(self.years, categories=categories, directory=self.snapshot_dir)
+        return synthetic.generate(self.rows, start_year=self.start_year)
+
+    def make_body(self) -> bytes:
+        body = {"help": "", "success": True, "result": {"resource_id": "bench", "records": self.get("records"), "total": self.rows}}
+        return json.dumps(body).encode("utf-8")
+
+    def make_raw(self) -> pd.DataFrame:
+        # as store.read_snapshot returns it: text as categoricals, numeric fields as numbers
+        return self.get("transactions")[dataset.raw_columns]
+
+    def make_coordinates(self) -> pd.DataFrame:
+        return f.get_coords_df()
+
+    def make_planning_areas(self) -> tuple:
+        return geo.get_planning_areas(f.get_chloropeth())
+
+    def make_town_lookup(self) -> pd.Series:
+        planning_areas, polygons = self.get("planning_areas")
+        addresses = self.get("raw")["block"].astype(str) + " " + self.get("raw")["street_name"].astype(str)
+        return pd.Series(geo.find_unique_locations(addresses, self.get("coordinates"), planning_areas, polygons))
+
+    def make_df(self) -> pd.DataFrame:
+        return dataset.transform_data(self.get("raw").copy(), self.get("coordinates"), self.get("town_lookup"))
+
+    def make_data(self) -> dataset.Dataset:
+        df = self.get("df")
+        return dataset.Dataset(
+            version="benchmark",
+            df=df,
+            df_raw=df.head(10),
+            cube=aggregates.build_cube(df),
+            filter_index=indexes.build_filter_index(df),
+            price_index=indexes.build_price_index(df),
+            histograms=histograms.build_histograms(df),
+        )
+
+    def make_views(self) -> aggregates.PeriodViews:
+        return aggregates.period_views(self.get("data"))
+
+    def make_chart_tables(self) -> histograms.ChartTables:
+        return histograms.chart_tables(self.get("data").histograms)
+
+    def make_map_boundaries(self) -> dict:
+        return f.get_chloropeth("medium")
+
+
+@benchmark("fetch.parse_stream")
+def bench_parse_stream(inputs: Inputs):
+    body = inputs.get("body")
+    chunk_size = 1 << 16
+
+    def run():
+        chunks = (body[i:i + chunk_size].decode("utf-8") for i in range(0, len(body), chunk_size))
+        return f.parse_stream(chunks)
+    yield run
+
+
+@benchmark("fetch.get_data")
+def bench_get_data(inputs: Inputs):
+    # the server runs in its own process, so its encoding and threads stay out of the timings
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        fixture_path = os.path.join(tmp_dir, "records.jsonl")
+        with open(fixture_path, "w") as file:
+            for item in inputs.get("records"):
+                file.write(json.dumps(item) + "\n")
+        server = subprocess.Popen(
+            [sys.executable, "-u", replay_server.__file__, "serve", "--port", "0", "--fixture", fixture_path],
+            stdout=subprocess.PIPE,
+            text=True,
+        )
+        try:
+            line = server.stdout.readline()
+            if not line.startswith("Serving"):
+                raise RuntimeError(f"Replay server failed to start: {line!r}")
+            f.api_url = line.split()[-1]
+            yield lambda: f.get_data(strict=True)
+        finally:
+            server.terminate()
+            server.wait()
+
+
+@benchmark("dataset.transform_data")
+def bench_transform(inputs: Inputs):
+    raw, coordinates, town_lookup = inputs.get("raw"), inputs.get("coordinates"), inputs.get("town_lookup")
+    yield lambda: dataset.transform_data(raw.copy(), coordinates, town_lookup)
+
+
+@benchmark("geo.find_unique_locations")
+def bench_find_unique_locations(inputs: Inputs):
+    raw = inputs.get("raw")
+    addresses = raw["block"].astype(str) + " " + raw["street_name"].astype(str)
+    coordinates = inputs.get("coordinates")
+    planning_areas, polygons = inputs.get("planning_areas")
+    yield lambda: geo.find_unique_locations(addresses, coordinates, planning_areas, polygons)
+
+
+@benchmark("dataset.indexes")
+def bench_indexes(inputs: Inputs):
+    df = inputs.get("df")
+
+    def run():
+        aggregates.build_cube(df)
+        indexes.build_filter_index(df)
+        indexes.build_price_index(df)
+        histograms.build_histograms(df)
+    yield run
+
+
+@benchmark("visuals.filter_aggregate")
+def bench_filter_aggregate(inputs: Inputs):
+    """
+    The Visuals page's filter and aggregation for each kind of selection: everything, the
+    busiest town, the latest year, and both.
+    """
+    data = inputs.get("data")
+    town = data.df["town"].value_counts().index[0]
+    year = int(data.df["date"].max().year)
+    cases = [(None, None), (town, None), (None, year), (town, year)]
+    for case_town, case_year in cases:
+        assert len(aggregates.period_views(data, case_town, case_year).df_filtered), f"No rows for {case_town}, {case_year}"
+
+    def run():
+        for case_town, case_year in cases:
+            aggregates.period_views(data, case_town, case_year)
+    yield run
+
+
+def figure_benchmark(name: str, view: str, build):
+    """
+    Register a chart benchmark. `build` makes the chart from the `view` input (the page's
+    prepared tables), and construction is timed together with the JSON serialization the
+    chart goes through on its way to the browser.
+    """
+    @benchmark("figure." + name)
+    def setup(inputs: Inputs):
+        views, map_boundaries = inputs.get(view), inputs.get("map_boundaries")
+        yield lambda: build(views, map_boundaries).to_json()
+    return setup
+
+
+# figures are only serialized, never rendered, so any non-empty token will do
+mapbox_token = os.environ.get("MAPBOX_TOKEN", "benchmark")
+flat_order = {"flat_type": ["1 ROOM", "2 ROOM", "3 ROOM", "4 ROOM", "5 ROOM", "EXECUTIVE", "MULTI-GENERATION"]}
+
+figure_benchmark("median_map", "views", lambda views, geojson: charts.median_map(views.choropleth_df, views.flats_df, geojson, "All Years", "S$1M", mapbox_token))
+figure_benchmark("transaction_map", "views", lambda views, geojson: charts.transaction_map(views.choropleth_df, geojson, "All Years", mapbox_token))
+figure_benchmark("transactions_line", "views", lambda views, _: charts.transactions_line(views.resale_transactions_df))
+figure_benchmark("price_index_line", "views", lambda views, _: charts.price_index_line(views.resale_transactions_df))
+figure_benchmark("median_price_line", "views", lambda views, _: charts.median_price_line(views.resale_transactions_df))
+figure_benchmark("million_dollar_scatter", "views", lambda views, _: charts.million_dollar_scatter(views.flats_df, "S$1M"))
+figure_benchmark("density_heatmap", "views", lambda views, _: charts.density_heatmap(views.df_filtered))
+figure_benchmark("resale_price_histogram", "chart_tables", lambda views, _: charts.resale_price_histogram(views.price_counts_total, views.price_bin_width, flat_order))
+figure_benchmark("resale_price_histogram_animated", "chart_tables", lambda views, _: charts.resale_price_histogram_animated(views.price_counts, views.price_bin_width, flat_order))
+figure_benchmark("remaining_lease_histogram", "chart_tables", lambda views, _: charts.remaining_lease_histogram(views.lease_counts))
+figure_benchmark("flat_type_charts", "chart_tables", lambda views, _: charts.flat_type_charts(views.flat_type_df, views.floor_area_df))
+
+
+def measure(run, repeat: int) -> dict:
+    """
+    Minimum and median time over `repeat` runs, then the peak traced memory of one more run,
+    kept separate as tracing slows the code down.
+    """
+    times = []
+    # the pipeline's progress messages are not part of the report
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run()
+            times.append(time.perf_counter() - start)
+        tracemalloc.start()
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return {"min": min(times), "median": statistics.median(times), "peak_mb": peak / 1e6}
+
+
+def git(*args) -> str:
+    try:
+        return subprocess.run(["git", *args], cwd=path, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def result_path(commit: str) -> str:
+    return os.path.join(results_dir, f"{commit}.json")
+
+
+def same_inputs(results: dict, other: dict) -> bool:
+    return (results["rows"], results.get("start_year")) == (other["rows"], other.get("start_year"))
+
+
+def save_results(results: dict):
+    """
+    Save a run under its commit. A run of the same commit on the same inputs is merged into
+    rather than replaced, so a filtered run only updates the benchmarks it ran.
+    """
+    os.makedirs(results_dir, exist_ok=True)
+    if os.path.exists(result_path(results["commit"])):
+        saved = load_results(results["commit"])
+        if same_inputs(saved, results):
+            results = dict(results, results=dict(saved["results"], **results["results"]))
+    tmp_path = result_path(results["commit"]) + ".tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(results, file, indent=2, sort_keys=True)
+    os.replace(tmp_path, result_path(results["commit"]))
+
+
+def load_results(commit: str) -> dict:
+    with open(result_path(commit)) as file:
+        return json.load(file)
+
+
+def previous_results(current: dict) -> dict:
+    """
+    The most recent saved run of another commit on the same inputs, or None.
+    """
+    candidates = []
+    for file_path in glob.glob(os.path.join(results_dir, "*.json")):
+        with open(file_path) as file:
+            results = json.load(file)
+        if results["commit"] != current["commit"] and same_inputs(results, current):
+            candidates.append(results)
+    return max(candidates, key=lambda results: results["date"], default=None)
+
+
+def delta(new: float, old: float) -> str:
+    if old is None or old == 0:
+        return ""
+    return f"{(new - old) / old * 100:+.1f}%"
+
+
+def report(current: dict, baseline: dict = None, threshold: float = 10.0) -> list:
+    """
+    Print each benchmark's time and peak memory, with deltas against the baseline, and
+    return the names whose median time regressed by more than `threshold` percent.
+    """
+    if baseline is not None:
+        print(f"Comparing {current['commit']} against {baseline['commit']} at {current['rows']:,} rows from {current['start_year']}")
+    regressions = []
+    print(f"{'benchmark':<42}{'median':>10}{'delta':>9}{'peak MB':>10}{'delta':>9}")
+    for name, result in current["results"].items():
+        old = baseline["results"].get(name) if baseline is not None else None
+        time_delta = delta(result["median"], old["median"]) if old else ""
+        memory_delta = delta(result["peak_mb"], old["peak_mb"]) if old else ""
+        flag = ""
+        if old and (result["median"] - old["median"]) / old["median"] * 100 > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<42}{result['median'] * 1000:>8,.1f}ms{time_delta:>9}{result['peak_mb']:>10,.1f}{memory_delta:>9}{flag}")
+    return regressions
+
+
+def run(args):
+    commit = git("rev-parse", "--short", "HEAD") or "unknown"
+    if git("status", "--porcelain", "--untracked-files=no"):
+        commit += "-dirty"
+    inputs = Inputs(args.rows, args.start_year, args.snapshot_dir)
+    if not inputs.rows:
+        sys.exit(f"No snapshot partitions from {args.start_year} found in {args.snapshot_dir}")
+    results = {
+        "commit": commit,
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "rows": inputs.rows,
+        "start_year": args.start_year,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "results": {},
+    }
+    for name, setup in registry.items():
+        if args.filter and args.filter not in name:
+            continue
+        print(f"Running {name}")
+        with setup(inputs) as timed:
+            results["results"][name] = measure(timed, args.repeat)
+    save_results(results)
+    baseline = load_results(args.baseline) if args.baseline else previous_results(results)
+    regressions = report(results, baseline, args.threshold)
+    if regressions and args.fail_on_regression:
+        sys.exit(f"{len(regressions)} benchmark(s) regressed by more than {args.threshold}%")
+
+
+def compare(args):
+    regressions = report(load_results(args.head), load_results(args.base), args.threshold)
+    if regressions and args.fail_on_regression:
+        sys.exit(f"{len(regressions)} benchmark(s) regressed by more than {args.threshold}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pipeline benchmark suite")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="run the benchmarks and save the results for this commit")
+    run_parser.add_argument("--rows", type=int, default=100_000)
+    run_parser.add_argument("--start-year", type=int, default=2017, help="first year of transactions, 1990 for the full history")
+    run_parser.add_argument("--snapshot-dir", help="read transactions from a synthetic.py snapshot instead of generating --rows")
+    run_parser.add_argument("--repeat", type=int, default=5)
+    run_parser.add_argument("--filter", help="only run benchmarks whose name contains this")
+    run_parser.add_argument("--baseline", help="commit to compare against, the previous saved run by default")
+    compare_parser = commands.add_parser("compare", help="compare the saved results of two commits")
+    compare_parser.add_argument("base")
+    compare_parser.add_argument("head")
+    for command_parser in [run_parser, compare_parser]:
+        command_parser.add_argument("--threshold", type=float, default=10.0, help="percentage slowdown reported as a regression")
+        command_parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        run(args)
+    elif args.command == "compare":
+        compare(args)
+
+
+if __name__ == "__main__":
+    main()
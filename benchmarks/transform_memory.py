@@ -0,0 +1,56 @@
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import dataset
+import fetch as f
+import geo
+import store
+
+"""
+Reports peak memory of reading a snapshot and transforming it into the dashboard frame,
+and the bytes per row of the result. Reads the local snapshot from running the app once,
+or a synthetic one at scale from assets/synthetic:
+
+    python benchmarks/transform_memory.py --years 2022 2023
+    python synthetic.py snapshot --rows 10000000 --start-year 1990
+    python benchmarks/transform_memory.py --snapshot-dir assets/synthetic
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Peak memory of the snapshot read and transform")
+    parser.add_argument("--years", nargs="*", help="snapshot partitions to load, all by default")
+    parser.add_argument("--snapshot-dir", default=store.snapshot_dir, help="snapshot to read, the local snapshot by default")
+    args = parser.parse_args()
+
+    if not store.read_manifest(args.snapshot_dir)["partitions"]:
+        sys.exit("No snapshot partitions found, run the app or synthetic.py snapshot first")
+    hdb_coordinates = f.get_coords_df()
+    planning_areas, polygons = geo.get_planning_areas(f.get_chloropeth())
+    town_lookup = geo.get_town_lookup(hdb_coordinates, planning_areas, polygons)
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    df = store.read_snapshot(years=args.years, columns=dataset.raw_columns, categories=dataset.raw_categories, directory=args.snapshot_dir)
+    read_seconds = time.perf_counter() - start
+    _, read_peak = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    start = time.perf_counter()
+    df = dataset.transform_data(df, hdb_coordinates, town_lookup)
+    transform_seconds = time.perf_counter() - start
+    _, transform_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    frame_bytes = df.memory_usage(deep=True).sum()
+    print(f"Rows: {len(df):,}")
+    print(f"read_snapshot  peak {read_peak / 1e6:>8,.1f} MB  {read_seconds:>6.2f}s")
+    print(f"transform_data peak {transform_peak / 1e6:>8,.1f} MB  {transform_seconds:>6.2f}s")
+    print(f"Final frame    {frame_bytes / 1e6:>8,.1f} MB  {frame_bytes / max(len(df), 1):,.1f} bytes per row")
+
+
+if __name__ == "__main__":
+    main()
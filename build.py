@@ -0,0 +1,42 @@
+import argparse
+import time
+import artifact
+import dataset
+import fetch as f
+import geo
+
+"""
+Offline build steps for derived assets served by the dashboard.
+
+    python build.py boundaries
+    python build.py dataset
+"""
+
+
+def build_boundaries():
+    geo.write_simplified_boundaries(f.get_chloropeth())
+
+
+def build_dataset():
+    start = time.perf_counter()
+    data, update = dataset.build_dataset(strict=True)
+    dataset.commit_update(update)
+    manifest = artifact.write_artifact(data, dataset.get_format_version())
+    print(f"Built dataset {manifest['version']} with {manifest['rows']:,} rows in {time.perf_counter() - start:,.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build derived dashboard assets")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("boundaries", help="simplified planning area boundaries for the maps")
+    commands.add_parser("dataset", help="fetch, transform and index the dataset into a memory-mappable artifact")
+    args = parser.parse_args()
+
+    if args.command == "boundaries":
+        build_boundaries()
+    elif args.command == "dataset":
+        build_dataset()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,566 @@
+import altair as alt
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+
+"""
+Chart builders for the dashboard pages. They take the prepared data as arguments rather
+than reading page state, so figures can be cached and benchmarked outside a page run.
+"""
+
+
+def add_marker(base_chart, nearest, tooltip_y_val:str, tooltip_y_title:str, tooltip_y_format:str):
+    '''
+    Adds a selector indicator and rule to altair chart
+    '''
+    # selectors that tell us the x-value of the cursor
+    selector = (
+        base_chart.mark_point(color="red")
+        .encode(
+            x="date",
+            opacity=alt.condition(nearest, alt.value(1), alt.value(0)),
+            tooltip=[
+                alt.Tooltip("date", title="Transaction Period", format="%b-%y"),
+                alt.Tooltip(
+                    tooltip_y_val, title=tooltip_y_title, format=tooltip_y_format
+                ),
+            ]
+        )
+        .add_selection(nearest)
+    )
+
+    # draw a rule at location of selection
+    rule = (
+        base_chart.mark_rule(color="gray")
+        .encode(x="date")
+        .transform_filter(nearest)
+    )
+
+    return selector, rule
+
+
+def get_scale(series: pd.Series) -> list[int, int]:
+    scale_min = int(series.min() * 0.9)
+    scale_max = int(series.max() * 1.1)
+    return [scale_min, scale_max]
+
+
+def transaction_labels(df: pd.DataFrame) -> pd.Series:
+    """
+    Hover text for each transaction, formatted once per distinct flat type, address and price
+    """
+    flat_types = df["flat_type"].cat.rename_categories(lambda c: c.title()).astype(str)
+    addresses = df["address"].cat.remove_unused_categories().cat.rename_categories(lambda c: c.title()).astype(str)
+    prices = df["resale_price"].astype("category").cat.rename_categories(lambda p: f"{p:,}").astype(str)
+    return flat_types + " flat at " + addresses + ", sold for $" + prices
+
+
+def median_map(choropleth_df: pd.DataFrame, flats_df: pd.DataFrame, geojson: dict, period: str, threshold_label: str, mapbox_token: str):
+    """
+    Choropleth of median resale price by town, with the transactions over the price threshold starred
+    """
+    median_map_plot = px.choropleth_mapbox(
+        choropleth_df,
+        geojson=geojson,
+        locations="town",
+        color="resale_price",
+        featureidkey="properties.PLN_AREA_N",
+        color_continuous_scale="burg",
+        center={"lat": 1.35, "lon": 103.80},
+        opacity=0.8,
+        hover_name="town",
+        hover_data={
+            "town": False,
+            "transactions": ":,",
+            "resale_price": ":,"
+        },
+        labels={"town": "Town", "transactions": "Transactions", "resale_price": "Median Resale Price"},
+    ).update_layout(
+        title={
+            "text": f"{period} Median Resale Price by Town",
+            "xanchor": "left",
+        },
+        height=600,
+        mapbox={
+            "accesstoken": mapbox_token,
+            "style": "streets",
+            "zoom": 10,
+            "bounds": {"west": 103.5, "east": 104.2, "north": 1.55, "south": 1.15} # not working locally
+        },
+        coloraxis_colorbar={
+            "title": None,
+            "y": 0.5,
+            "yanchor": "middle",
+            "len": 1,
+            "ypad": 0,
+            "xpad": 0
+        }
+    )
+
+    median_map_plot.add_scattermapbox(
+        below="",
+        lat=flats_df["latitude"],
+        lon=flats_df["longitude"],
+        text=transaction_labels(flats_df),
+        mode="markers",
+        marker={"symbol": "star", "size": 5, "opacity": 0.9, "allowoverlap": True},
+        hovertemplate=f"<b>{threshold_label} Flat</b><br><br>"
+        + "%{text}"
+        + "<extra></extra>",
+        hoverlabel={
+            "bgcolor": "snow",
+            "font_color" : "black"
+        },
+    )
+
+    # Add buttons for control
+    median_map_plot.update_layout(
+        updatemenus=[
+            dict(
+                type = "buttons",
+                direction = "right",
+                buttons=list([
+                    dict(
+                        args=["mapbox_style", "streets"],
+                        label="Streets",
+                        method="relayout"
+                    ),
+                    dict(
+                        args=["mapbox_style", "dark"],
+                        label="Dark",
+                        method="relayout"
+                    )
+                ]),
+                pad={"r": 10, "t": 10},
+                showactive=True,
+                x=0.05,
+                xanchor="left",
+                y=-0.07,
+                yanchor="bottom",
+                visible=False # hide while buttons not working
+            ),
+            dict(
+                type = "buttons",
+                direction = "right",
+                buttons=list([
+                    dict(
+                        args=["color", "resale_price"],
+                        label="Median Price",
+                        method="restyle"
+                    ),
+                    dict(
+                        args=["color", "transactions"],
+                        label="Transactions",
+                        method="restyle"
+                    )
+                ]),
+                pad={"r": 10, "t": 10},
+                showactive=True,
+                x=0.05,
+                xanchor="left",
+                y=-0.14,
+                yanchor="bottom",
+                visible=False # hide while buttons not working
+            ),
+        ],
+        overwrite=True
+    )
+
+    # Add annotation
+    median_map_plot.update_layout(
+        annotations=[
+            dict(
+                text="Map style:", 
+                showarrow=False,
+                x=0, 
+                y=-0.06, 
+                yref="paper", 
+                align="left"),
+            dict(
+                text="Overlay:", 
+                showarrow=False,
+                x=0,
+                y=-0.13, 
+                yref="paper", 
+                align="left")
+        ],
+    )
+
+    return median_map_plot
+
+
+def transaction_map(choropleth_df: pd.DataFrame, geojson: dict, period: str, mapbox_token: str):
+    """
+    Choropleth of the median age of property at transaction by town
+    """
+    transaction_map_plot = px.choropleth_mapbox(
+        choropleth_df,
+        geojson=geojson,
+        locations="town",
+        color="age",
+        featureidkey="properties.PLN_AREA_N",
+        color_continuous_scale="mint",
+        center={"lat": 1.35, "lon": 103.80},
+        opacity=0.8,
+        hover_name="town",
+        hover_data={
+            "town": False,
+            "age": True,
+            "resale_price": ":,",
+        },
+        labels={"town": "Town", "age": "Median Age", "resale_price": "Median Resale Price"},
+    ).update_layout(
+        title={
+            "text": f"{period} Median Age of Property at Transaction",
+            "x": 0.5,
+            "xanchor": "center",
+        },
+        height=600,
+        mapbox={
+            "accesstoken": mapbox_token,
+            "style": "streets",
+            "zoom": 10,
+            "bounds": {"west": 103.5, "east": 104.2, "north": 1.55, "south": 1.15} # not working locally
+        },
+        coloraxis_colorbar={
+            "title": None,
+            "y": 0.5,
+            "yanchor": "middle",
+            "len": 1,
+            "ypad": 0,
+            "xpad": 0
+        }
+    )
+
+    return transaction_map_plot
+
+
+def transactions_line(resale_transactions_df: pd.DataFrame):
+    """
+    Monthly transaction count, with a marker following the cursor
+    """
+    transactions_base = (
+        alt.Chart(resale_transactions_df, title="Total Transactions per Month")
+        .mark_line(
+            color="green"
+        )
+        .encode(
+            alt.X(
+                "date:T",
+                axis=alt.Axis(
+                    formatType="time",
+                    format="%b-%y",
+                    title=None,
+                    grid=False,
+                    tickCount="month",
+                ),
+            ),
+            alt.Y(
+                "town:Q",
+                axis=alt.Axis(
+                    title="Transactions",
+                    formatType="number",
+                )
+            ),
+        )
+        .properties(
+            height=350,
+        )
+    )
+
+    # creates selection that chooses the nearest point
+    nearest = alt.selection_single(
+        nearest=True, on="mouseover", fields=["date"], empty="none"
+    )
+
+    selector, rule = add_marker(transactions_base, nearest, "town", "Resale Transactions", ",")
+    return transactions_base + selector + rule
+
+
+def price_index_line(resale_transactions_df: pd.DataFrame):
+    """
+    Monthly resale price index, with a reference line at 100 when it is in range
+    """
+    price_index_base = (
+        alt.Chart(resale_transactions_df, title="Resale Price Index^")
+        .mark_line(
+            color="orange"
+        )
+        .encode(
+            alt.X(
+                "date:T",
+                axis=alt.Axis(
+                    formatType="time",
+                    format="%b-%y",
+                    title="Transaction Period",
+                    grid=False,
+                    tickCount="month",
+                )
+            ),
+            alt.Y(
+                "price_index:Q", 
+                axis=alt.Axis(
+                    title="Price Index",
+                    grid=False
+                ),
+                scale=alt.Scale(domain=get_scale(resale_transactions_df["price_index"]))
+            )
+        )
+        .properties(
+            height=350,
+        )
+    )
+
+    # creates selection that chooses the nearest point
+    nearest = alt.selection_single(
+        nearest=True, on="mouseover", fields=["date"], empty="none"
+    )
+
+    selector, rule = add_marker(price_index_base, nearest, "price_index", "Price Index", ",")
+    # show line at price index = 100
+    if resale_transactions_df.price_index.min() <= 100 and resale_transactions_df.price_index.max() >= 100:
+        index_line = alt.Chart(
+            resale_transactions_df).mark_rule(color="gray", strokeDash=[4, 4], strokeOpacity=0.1).encode(y=alt.datum(100)
+            )
+        return price_index_base + selector + rule + index_line
+    return price_index_base + selector + rule
+
+
+def median_price_line(resale_transactions_df: pd.DataFrame):
+    """
+    Monthly median resale price, with a marker following the cursor
+    """
+    median_price_base = (
+        alt.Chart(resale_transactions_df, title="Median Resale Price^ by Month")
+        .mark_line()
+        .encode(
+            alt.X(
+                "date:T",
+                axis=alt.Axis(
+                    formatType="time",
+                    format="%b-%y",
+                    title="Transaction Period",
+                    grid=False,
+                    tickCount="month",
+                ),
+            ),
+            alt.Y(
+                "resale_price:Q",
+                axis=alt.Axis(
+                    title="Resale Price (S$)", formatType="number", format="~s"
+                ),
+            ),
+        )
+        .properties(
+            height=350,
+        )
+    )
+
+    # creates selection that chooses the nearest point
+    nearest = alt.selection_single(
+        nearest=True, on="mouseover", fields=["date"], empty="none"
+    )
+
+    selector, rule = add_marker(median_price_base, nearest, "resale_price", "Median Resale Price", "$,")
+    return median_price_base + selector + rule
+
+
+def million_dollar_scatter(flats_df: pd.DataFrame, threshold_label: str):
+    """
+    Transactions over the price threshold by date, coloured by floor area
+    """
+    return px.scatter(
+        flats_df,
+        x="date",
+        y="resale_price",
+        color="floor_area_sqm",
+        title="address",
+        hover_name="address",
+        hover_data={
+            "date": "|%b %Y",
+            "resale_price": ":$,",
+        },
+        labels={
+            "date": "Transaction Date", "resale_price": "Resale Price", "floor_area_sqm": "Floor Area (sqm)"
+        }
+    ).update_layout(
+        title=f"{threshold_label} Resale Transactions",
+        xaxis_title="Transaction Date",
+        yaxis_title="Resale Price (S$)",
+        height=350,
+        coloraxis_colorbar={
+            "title": "Floor Area (sqm)",
+            "y": 0.5,
+            "yanchor": "middle",
+            "len": 1,
+            "ypad": 0,
+            "xpad": 0
+        }
+    )
+
+
+def density_heatmap(df: pd.DataFrame, bin_width: int = 10):
+    """
+    Average resale price by floor area and storey range, averaged into `bin_width` sqm
+    floor area bins here so the figure holds the grid rather than every transaction
+    """
+    floor_area_bin = df["floor_area_sqm"].to_numpy() // bin_width * bin_width + bin_width / 2
+    grid = (
+        pd.DataFrame({"storey_range": df["storey_range"].astype(str).to_numpy(), "floor_area_sqm": floor_area_bin, "resale_price": df["resale_price"].to_numpy()})
+        .groupby(["storey_range", "floor_area_sqm"])["resale_price"]
+        .mean()
+        .unstack()
+        .sort_index()
+    )
+    return go.Figure(
+        go.Heatmap(
+            x=grid.columns,
+            y=grid.index,
+            z=grid.to_numpy(),
+            coloraxis="coloraxis",
+            hovertemplate="Floor Area (sqm)=%{x}<br>Storey Range=%{y}<br>Average Resale Price=%{z:,.0f}<extra></extra>",
+        )
+    ).update_layout(
+        title={
+            "text": f"Effects of Floor Area and Storey Range on Resale Price",
+            "xanchor": "left",
+        },
+        xaxis_title="Floor Area (sqm)",
+        yaxis_title="Storey Range",
+        height=400,
+        coloraxis_colorbar={
+            "title": "Average Resale Price",
+            "y": 0.5,
+            "yanchor": "middle",
+            "len": 1,
+            "ypad": 0,
+            "xpad": 0
+        }
+    )
+
+
+def resale_price_histogram(price_counts: pd.DataFrame, bin_width: float, category_orders: dict):
+    """
+    Resale price histogram by flat type, from bin counts summed over years
+    """
+    return px.bar(
+        price_counts,
+        x="resale_price",
+        y="count",
+        color="flat_type",
+        opacity=0.8,
+        barmode="overlay",
+        title="Distribution of Resale Price",
+        category_orders=category_orders
+    ).update_traces(
+        width=bin_width
+    ).update_layout(
+        xaxis_title="Resale Price (S$)",
+        yaxis_title="Frequency",
+        bargap=0,
+        height=450,
+        legend={
+            "orientation": "h",
+            "y": 1.12,
+            "x": 0.2,
+            "title": None
+        }
+    )
+
+
+def resale_price_histogram_animated(price_counts: pd.DataFrame, bin_width: float, category_orders: dict):
+    """
+    Resale price histogram by flat type, one animation frame per year
+    """
+    return px.bar(
+        price_counts,
+        x="resale_price",
+        y="count",
+        animation_frame="year",
+        color="flat_type",
+        range_x=[price_counts["bin_start"].min(), price_counts["bin_end"].max()],
+        range_y=[0, price_counts["count"].max() * 1.1],
+        title="Distribution of Resale Price by Year",
+        opacity=0.8,
+        barmode="overlay",
+        category_orders=category_orders
+    ).update_traces(
+        width=bin_width
+    ).update_layout(
+        xaxis_title="Resale Price (S$)",
+        yaxis_title="Frequency",
+        bargap=0,
+        height=550,
+        legend={
+            "orientation": "h",
+            "y": 1.12,
+            "x": 0.2,
+            "title": None
+        }
+    )
+
+
+def remaining_lease_histogram(lease_counts: pd.DataFrame):
+    """
+    Share of transactions by remaining lease
+    """
+    return px.bar(
+        lease_counts,
+        x="remaining_lease",
+        y="percent",
+        opacity=0.8,
+        title="Distribution of Remaining Lease (Years)",
+        color_discrete_sequence=['dodgerblue'],
+    ).update_layout(
+        xaxis_title="Remaining Lease",
+        yaxis_title="Frequency",
+        bargap=0,
+        height=450,
+    )
+
+
+def flat_type_charts(flat_type_df: pd.DataFrame, floor_area_df: pd.DataFrame):
+    """
+    Transactions by flat type beside the floor area distribution, filtered by clicking a flat type
+    """
+    flat_type_selector = alt.selection_multi(empty="all", fields=["flat_type"])
+
+    flat_type_plot = (
+        alt.Chart(flat_type_df)
+        .mark_bar()
+        .encode(
+            alt.X("count:Q", axis=alt.Axis(title="Transactions")),
+            alt.Y("flat_type:N", axis=alt.Axis(title="Flat Type")),
+            color=alt.condition(
+                flat_type_selector, "flat_type:N", alt.value("lightgray"), legend=None
+            ),
+            tooltip=[
+                alt.Tooltip("flat_type", title="Flat Type"),
+                alt.Tooltip("count:Q", title="Transactions", format=","),
+            ],
+        )
+        .add_selection(flat_type_selector)
+        .properties(height=250, title="Transactions by Flat Type")
+    )
+
+    floor_area_plot = (
+        alt.Chart(floor_area_df)
+        .mark_bar(opacity=0.8, binSpacing=0)
+        .encode(
+            alt.X(
+                "bin_start:Q",
+                bin="binned",
+                axis=alt.Axis(title="Floor Area (sqm)"),
+            ),
+            alt.X2("bin_end:Q"),
+            alt.Y("count:Q", stack=None, axis=alt.Axis(title="Count")),
+            alt.Color("flat_type:N", legend=None),
+        )
+        .transform_filter(flat_type_selector)
+        .properties(
+            height=250,
+            title="Distribution of Floor Area by Flat Type"
+        )
+    )
+
+    return flat_type_plot | floor_area_plot
@@ -0,0 +1,400 @@
+import hashlib
+import json
+import threading
+import time
+from dataclasses import dataclass, fields, is_dataclass
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import streamlit as st
+import aggregates
+import artifact
+import fetch as f
+import geo
+import histograms
+import indexes
+import store
+
+"""
+Loads and transforms the resale dataset once per process, so every session and page
+shares a single read-only copy instead of keeping its own in session_state.
+"""
+
+# raw columns used by transform_data, the rest are left on disk
+raw_columns = ["month", "town", "flat_type", "block", "street_name", "storey_range", "floor_area_sqm", "flat_model", "lease_commence_date", "resale_price"]
+# raw text columns, read from the snapshot as categoricals
+raw_categories = ["month", "town", "flat_type", "block", "street_name", "storey_range", "flat_model"]
+
+# dtypes of the transformed frame, in column order
+schema = {
+    "town": "category",
+    "flat_type": "category",
+    "flat_model": "category",
+    "floor_area_sqm": "int16",
+    "price_per_sqm": "float32",
+    "date": "datetime64[ns]",
+    "year": "category",
+    "remaining_lease": "int16",
+    "lease_commence_date": "int16",
+    "storey_range": "category",
+    "address": "category",
+    "latitude": "float32",
+    "longitude": "float32",
+    "resale_price": "int32",
+}
+
+
+@dataclass(frozen=True)
+class Dataset:
+    """
+    One version of the transformed dataset. The frames are shared by all sessions,
+    so treat them as read-only and copy before modifying.
+    """
+    version: str
+    df: pd.DataFrame
+    df_raw: pd.DataFrame
+    cube: aggregates.Cube
+    filter_index: indexes.FilterIndex
+    price_index: indexes.PriceIndex
+    histograms: histograms.Histograms
+
+
+# bump when transform_data or the derived structures change in a way the schema and fields don't show
+artifact_format = 1
+
+
+def dataclass_layout(cls) -> dict:
+    return {field.name: dataclass_layout(field.type) if is_dataclass(field.type) else str(field.type) for field in fields(cls)}
+
+
+def get_format_version() -> str:
+    """
+    Short hash of everything besides the data that shapes a published artifact: the schema,
+    the fields of Dataset and the structures inside it, the pyarrow version and `artifact_format`.
+    An artifact written by a different build of the app does not match and is rebuilt.
+    """
+    layout = [artifact_format, schema, dataclass_layout(Dataset), pa.__version__]
+    return hashlib.sha256(json.dumps(layout, sort_keys=True).encode()).hexdigest()[:12]
+
+
+@dataclass(frozen=True)
+class SnapshotUpdate:
+    """
+    Records fetched for a build, staged next to the snapshot but not yet part of it,
+    and the fetch state to record once they are.
+    """
+    manifest: dict
+    fetch_state: dict
+
+
+def fetch_update(strict: bool = False) -> SnapshotUpdate:
+    """
+    Fetch the records added since the snapshot was last written and stage them.
+    """
+    store.migrate_legacy()
+    watermark = store.get_watermark()
+    df_web, fetch_state = f.get_data_since(watermark, strict=strict)
+    manifest = store.stage_snapshot(df_web, watermark) if not df_web.empty else store.read_manifest()
+    return SnapshotUpdate(manifest, fetch_state)
+
+
+def load_data(update: SnapshotUpdate):
+    df = store.read_snapshot(columns=raw_columns, categories=raw_categories, manifest=update.manifest)
+    hdb_coordinates = f.get_coords_df()
+    geo_df = f.get_chloropeth()
+    return df, hdb_coordinates, geo_df
+
+
+def commit_update(update: SnapshotUpdate):
+    store.commit_snapshot(update.manifest)
+    # only recorded once the records are in the snapshot, so a failed write is fetched again
+    f.write_state(update.fetch_state)
+
+
+def discard_update(update: SnapshotUpdate):
+    store.discard_snapshot(update.manifest)
+
+
+def take(categories, codes: np.ndarray) -> pd.Categorical:
+    """
+    Categorical of `categories[codes]` built from codes alone, deduplicating the categories
+    so derived values (e.g. two months in the same year) share a code.
+    """
+    unique_codes, unique_categories = pd.factorize(pd.Index(categories), sort=True)
+    taken = np.where(codes >= 0, unique_codes[codes], -1)
+    return pd.Categorical.from_codes(taken, categories=unique_categories)
+
+
+def transform_data(df, hdb_coordinates, town_lookup):
+    """
+    Works on the categorical codes of the raw columns throughout: every string, date and
+    lookup is computed once per distinct value and gathered by code, so no intermediate
+    object columns are created. Returns a frame matching `schema`.
+    """
+    blocks, streets = df["block"].cat, df["street_name"].cat
+    # address from the distinct (block, street_name) pairs present, not from every row
+    pairs = blocks.codes.to_numpy().astype("int64") * len(streets.categories) + streets.codes.to_numpy()
+    unique_pairs, pair_codes = np.unique(pairs, return_inverse=True)
+    pair_addresses = (
+        blocks.categories[unique_pairs // len(streets.categories)]
+        + " "
+        + streets.categories[unique_pairs % len(streets.categories)]
+    )
+    address = take(pair_addresses, pair_codes)
+    address_codes = address.codes
+
+    months = df["month"].cat
+    month_dates = pd.to_datetime(months.categories, format="%Y-%m", errors="raise")
+    date = month_dates[months.codes.to_numpy()]
+    year = take(month_dates.year, months.codes.to_numpy())
+    lease_commence_date = df["lease_commence_date"].to_numpy().astype("int16")
+    floor_area_sqm = df["floor_area_sqm"].to_numpy().astype("int16")
+    resale_price = df["resale_price"].to_numpy().astype("int32")
+    coordinates = hdb_coordinates.reindex(address.categories)
+
+    df_transformed = pd.DataFrame({
+        "town": take(town_lookup.reindex(address.categories).to_numpy(), address_codes),
+        "flat_type": df["flat_type"].array,
+        "flat_model": df["flat_model"].array,
+        "floor_area_sqm": floor_area_sqm,
+        "price_per_sqm": resale_price.astype("float32") / floor_area_sqm,
+        "date": date,
+        "year": year,
+        "remaining_lease": (lease_commence_date + 99 - date.year.to_numpy()).astype("int16"),
+        "lease_commence_date": lease_commence_date,
+        "storey_range": df["storey_range"].array,
+        "address": address,
+        "latitude": coordinates["latitude"].to_numpy().astype("float32")[address_codes],
+        "longitude": coordinates["longitude"].to_numpy().astype("float32")[address_codes],
+        "resale_price": resale_price,
+    })
+    # date order keeps each year a contiguous range of rows for the filter index
+    return df_transformed.astype(schema).sort_values("date", kind="stable", ignore_index=True)
+
+
+def get_version(manifest: dict = None) -> str:
+    """
+    Short hash of the snapshot partitions, the town lookup they were joined with and the
+    artifact format, so a deploy that changes the format publishes a new version.
+    """
+    partitions = (manifest or store.read_manifest())["partitions"]
+    digest = hashlib.sha256(f"{geo.lookup_version}:{get_format_version()}".encode())
+    for year in sorted(partitions):
+        digest.update(partitions[year]["sha256"].encode())
+    return digest.hexdigest()[:12]
+
+
+def make_dataset(update: SnapshotUpdate) -> Dataset:
+    """
+    Transform the snapshot, with the staged records of `update`, and derive the cube,
+    indexes and histograms from it.
+    """
+    df, hdb_coordinates, geo_df = load_data(update)
+    if df.empty:
+        raise ValueError("No resale records: the snapshot is empty and none were fetched")
+    planning_areas, polygons = geo.get_planning_areas(geo_df)
+    town_lookup = geo.get_town_lookup(hdb_coordinates, planning_areas, polygons)
+    df_raw = df.head(10).copy()
+    df = transform_data(df, hdb_coordinates, town_lookup)
+    print(f"Transformed {len(df):,} rows, {df.memory_usage(deep=True).sum() / max(len(df), 1):,.1f} bytes per row")
+    return Dataset(
+        version=get_version(update.manifest),
+        df=df,
+        df_raw=df_raw,
+        cube=aggregates.build_cube(df),
+        filter_index=indexes.build_filter_index(df),
+        price_index=indexes.build_price_index(df),
+        histograms=histograms.build_histograms(df),
+    )
+
+
+def build_dataset(strict: bool = False) -> tuple:
+    """
+    Build and validate the dataset from the snapshot and any newly fetched records. The new
+    records are only staged: returns the dataset and the SnapshotUpdate to pass to
+    `commit_update` once the dataset is accepted, or to `discard_update` if it is not.
+    """
+    update = fetch_update(strict)
+    try:
+        data = make_dataset(update)
+        validate_dataset(data)
+    except Exception:
+        discard_update(update)
+        raise
+    return data, update
+
+
+# published versions older than this are refreshed in the background, keeping the old one in service
+refresh_interval = 86_400
+# wait this long before retrying a failed refresh
+retry_interval = 3_600
+# how often the refresher checks whether a refresh is due
+check_interval = 600
+# how often a process waiting on another's build checks whether it has been published
+lock_poll_interval = 2
+build_lock = threading.Lock()
+
+
+def publish_dataset() -> str:
+    """
+    Build the dataset and publish it for every worker, unless another process got there
+    first. The build holds the refresh lock shared by all processes, so when several workers
+    start without a usable artifact only one fetches and writes the snapshot, and the others
+    wait for it to publish. The build fetches strictly and is validated before its records
+    are committed, so a failed fetch raises rather than publishing partial data. Returns the
+    published version.
+    """
+    with build_lock:
+        while True:
+            pointer = artifact.read_pointer()
+            if artifact.is_compatible(pointer, get_format_version()):
+                return pointer["version"]
+            lock = artifact.acquire_lock()
+            if lock is not None:
+                try:
+                    # another process may have published while this one waited for the lock
+                    pointer = artifact.read_pointer()
+                    if artifact.is_compatible(pointer, get_format_version()):
+                        return pointer["version"]
+                    data, update = build_dataset(strict=True)
+                    commit_update(update)
+                    return artifact.write_artifact(data, get_format_version())["version"]
+                finally:
+                    artifact.release_lock(lock)
+            time.sleep(lock_poll_interval)
+
+
+def validate_dataset(data: Dataset, previous: Dataset = None):
+    """
+    Raise ValueError if a rebuilt dataset should not replace the one in service: it must
+    match the schema, have prices and dates for every row, and, as resale records are only
+    ever added, hold at least as many rows and months as the previous version.
+    """
+    if data.df.empty:
+        raise ValueError("Dataset has no rows")
+    dtypes = {column: str(dtype) for column, dtype in data.df.dtypes.items()}
+    if dtypes != schema:
+        raise ValueError(f"Dataset columns {dtypes} do not match the schema")
+    if data.df[["date", "resale_price"]].isna().any().any():
+        raise ValueError("Dataset has rows without a date or resale price")
+    if previous is not None:
+        if len(data.df) < len(previous.df):
+            raise ValueError(f"Dataset shrank from {len(previous.df):,} to {len(data.df):,} rows")
+        if data.df["date"].max() < previous.df["date"].max():
+            raise ValueError(f"Latest month went back from {previous.df['date'].max():%Y-%m} to {data.df['date'].max():%Y-%m}")
+
+
+def refresh_dataset():
+    """
+    Rebuild the dataset from the API and publish it if it changed and passes validation.
+    Only one process refreshes at a time and the outcome is recorded for the pages to show.
+    Any failure leaves the previous version in service, and the fetched records out of the
+    snapshot, as they are only committed to it once the rebuilt dataset is accepted.
+    """
+    lock = artifact.acquire_lock()
+    if lock is None:
+        return
+    status = {"started": time.time()}
+    update = None
+    try:
+        pointer = artifact.read_pointer()
+        update = fetch_update(strict=True)
+        version = get_version(update.manifest)
+        # the version hashes the partitions, so a match means there is nothing to rebuild
+        if artifact.is_compatible(pointer, get_format_version()) and version == pointer["version"]:
+            commit_update(update)
+            artifact.publish(version, get_format_version())
+            status.update(outcome="unchanged", message=f"No new records, still serving {version}")
+        else:
+            data = make_dataset(update)
+            previous = None
+            # an artifact in an older format may not even read back into the current Dataset
+            if artifact.is_compatible(pointer, get_format_version()):
+                previous = artifact.read_artifact(Dataset, pointer["version"])
+            validate_dataset(data, previous)
+            commit_update(update)
+            artifact.write_artifact(data, get_format_version())
+            status.update(outcome="published", message=f"Published {data.version} with {len(data.df):,} rows")
+    except Exception as error:
+        if update is not None:
+            discard_update(update)
+        status.update(outcome="failed", message=f"{type(error).__name__}: {error}")
+    finally:
+        status["finished"] = time.time()
+        artifact.write_status(status)
+        artifact.release_lock(lock)
+    print(f"Dataset refresh {status['outcome']}: {status['message']}")
+
+
+def refresh_due() -> bool:
+    pointer = artifact.read_pointer()
+    if pointer is None:
+        return False
+    status = artifact.read_status()
+    if status is not None and status["outcome"] == "failed" and time.time() - status["finished"] < retry_interval:
+        return False
+    return time.time() - pointer["published"] > refresh_interval
+
+
+def run_refresher():
+    while True:
+        # an error here, such as a full disk, must not stop refreshes for the life of the process
+        try:
+            if refresh_due():
+                refresh_dataset()
+        except Exception as error:
+            print(f"Dataset refresher error: {type(error).__name__}: {error}")
+        time.sleep(check_interval)
+
+
+@st.cache_resource
+def start_refresher() -> threading.Thread:
+    """
+    One background refresher per process, started with the first session.
+    """
+    thread = threading.Thread(target=run_refresher, name="dataset-refresher", daemon=True)
+    thread.start()
+    return thread
+
+
+def refresh_summary() -> str:
+    """
+    When the data in service was published and the outcome of the last refresh attempt.
+    """
+    pointer = artifact.read_pointer()
+    if pointer is None:
+        return "Data has not been published yet"
+    summary = f"Data published {time.strftime('%d %b %Y %H:%M', time.localtime(pointer['published']))}"
+    status = artifact.read_status()
+    if status is not None:
+        finished = time.strftime("%d %b %Y %H:%M", time.localtime(status["finished"]))
+        summary += f", last refresh {finished}: {status['message']}"
+    return summary
+
+
+@st.cache_resource(show_spinner="Opening data...", max_entries=1)
+def attach_dataset(version: str) -> Dataset:
+    start = time.perf_counter()
+    data = artifact.read_artifact(Dataset, version)
+    print(f"Attached dataset {version} in {(time.perf_counter() - start) * 1000:,.0f} ms")
+    return data
+
+
+def get_dataset() -> Dataset:
+    """
+    The published version of the dataset, memory-mapped read-only and shared by every session
+    of this process and, through the page cache, every worker process. A newly published
+    version is picked up on the next rerun without restarting.
+
+    Only the very first session, with nothing published yet, waits for the dataset to be
+    built. After that a background refresher rebuilds it off the request path, and sessions
+    keep being served the published version until a new one has been validated.
+    """
+    start_refresher()
+    pointer = artifact.read_pointer()
+    if not artifact.is_compatible(pointer, get_format_version()):
+        with st.spinner("Fetching data..."):
+            version = publish_dataset()
+    else:
+        version = pointer["version"]
+    return attach_dataset(version)
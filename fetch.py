@@ -1,8 +1,14 @@
 import requests
+import codecs
 import json
+import random
+import threading
 import time
 import os
+import numpy as np
 import pandas as pd
+from array import array
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 """
 Helper functions to fetch data through Data.gov.sg API.
@@ -18,51 +24,343 @@ resource_ids = [
 
 path = os.path.dirname(__file__)
 
-def retrieve_data(resource_id: str, n: int):
-    url_string = f"https://data.gov.sg/api/action/datastore_search?resource_id={resource_id}&limit={n}"
-    try:
-        response = requests.get(
-            url_string, headers={"User-Agent": "Mozilla/5.0"}, timeout=20
-        ).json()
-        if response["success"] == True:
-            print("Call success")
+# point at a local replay_server.py instance to run offline
+api_url = os.environ.get("HDB_API_URL", "https://data.gov.sg/api/action/datastore_search")
+page_size = 10_000  # records per datastore_search call when paginating
+max_workers = 4  # concurrent page requests per resource
+max_retries = 5  # attempts per request before giving up on the resource
+backoff_base = 0.5  # seconds, doubled on every retry
+backoff_cap = 30  # seconds, upper bound for a single wait
+retry_statuses = {429, 500, 502, 503, 504}
+state_path = path + "/assets/fetch_state.json"  # validators and totals from the last sync
+
+# fields parsed into float64 buffers, everything else is kept as (interned) text
+numeric_fields = ["_id", "floor_area_sqm", "lease_commence_date", "resale_price"]
+
+json_decoder = json.JSONDecoder()
+
+
+def append_record(columns: dict, record: dict, strings: dict):
+    """
+    Append one decoded record to the typed column buffers.
+
+    Repeated text values (towns, flat types, street names) are interned through
+    `strings`, so each distinct value is held once however many rows share it.
+    """
+    for field, value in record.items():
+        buffer = columns.get(field)
+        if buffer is None:
+            buffer = columns[field] = array("d") if field in numeric_fields else []
+        if field in numeric_fields:
+            buffer.append(float("nan") if value is None or value == "" else float(value))
+        else:
+            buffer.append(strings.setdefault(value, value))
+
+
+def parse_stream(chunks, strings: dict = None) -> tuple:
+    """
+    Decode a datastore_search response incrementally from an iterable of text chunks.
+
+    Records are decoded one object at a time from the "records" array and written
+    straight into column buffers, so the list of record dicts is never built.
+    Returns the response envelope (with "records" emptied) and a dict of column arrays.
+    """
+    if strings is None:
+        strings = {}
+    columns = {}
+    head, tail, buffer = "", "", ""
+    state = "head"
+    for chunk in chunks:
+        buffer += chunk
+        if state == "head":
+            start = buffer.find('"records"')
+            start = buffer.find("[", start) if start >= 0 else -1
+            if start < 0:
+                continue
+            head, buffer, state = buffer[:start], buffer[start + 1:], "records"
+        if state == "records":
+            pos = 0
+            while True:
+                while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                    pos += 1
+                if pos >= len(buffer):
+                    break
+                if buffer[pos] == "]":
+                    buffer, state = buffer[pos + 1:], "tail"
+                    break
+                try:
+                    record, pos = json_decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    break  # record continues in the next chunk
+                append_record(columns, record, strings)
+            if state == "records":
+                buffer = buffer[pos:]
+        if state == "tail":
+            tail, buffer = tail + buffer, ""
+    if state == "head":
+        return json.loads(head + buffer), {}
+    envelope = json.loads(head + "[]" + tail)
+    return envelope, {
+        field: np.frombuffer(buffer, dtype="float64") if field in numeric_fields else np.array(buffer, dtype=object)
+        for field, buffer in columns.items()
+    }
+
+
+def concat_pages(pages: list) -> pd.DataFrame:
+    """
+    Stitch columnar pages back into one frame, in the order given.
+    """
+    pages = [page for page in pages if page]
+    if not pages:
+        return pd.DataFrame()
+    return pd.DataFrame({field: np.concatenate([page[field] for page in pages]) for field in pages[0]})
+
+
+session_lock = threading.Lock()
+session = None
+
+
+def get_session() -> requests.Session:
+    """
+    Shared keep-alive session, with a connection pool large enough for the page workers.
+    """
+    global session
+    with session_lock:
+        if session is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers.update({"User-Agent": "Mozilla/5.0"})
+        return session
+
+
+def backoff_delay(attempt: int, retry_after: str = None) -> float:
+    """
+    Exponential backoff with full jitter, deferring to the server's Retry-After when given.
+    """
+    if retry_after is not None and retry_after.isdigit():
+        return min(backoff_cap, float(retry_after))
+    return random.uniform(0, min(backoff_cap, backoff_base * 2 ** attempt))
+
+
+def retrieve_data(resource_id: str, n: int, offset: int = 0, sort: str = None, strings: dict = None, validators: dict = None):
+    """
+    Call datastore_search, retrying connection errors, truncated bodies, 429 and 5xx responses.
+
+    When `validators` from a previous call are given the request is made conditional,
+    and None is returned if the server answers 304 Not Modified.
+    """
+    params = {"resource_id": resource_id, "limit": n, "offset": offset}
+    if sort is not None:
+        params["sort"] = sort
+    headers = {}
+    if validators:
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+    for attempt in range(1, max_retries + 1):
+        retry_after = None
+        try:
+            with get_session().get(api_url, params=params, headers=headers, timeout=20, stream=True) as r:
+                if r.status_code == 304:
+                    return None
+                retry_after = r.headers.get("Retry-After")
+                r.raise_for_status()
+                chunks = codecs.iterdecode(r.iter_content(chunk_size=1 << 16), "utf-8")
+                response, columns = parse_stream(chunks, strings)
+                response["validators"] = {
+                    "etag": r.headers.get("ETag"),
+                    "last_modified": r.headers.get("Last-Modified"),
+                }
+        except requests.HTTPError as e:
+            if e.response.status_code not in retry_statuses or attempt == max_retries:
+                raise
+            error = e
+        except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError, json.JSONDecodeError) as e:
+            if attempt == max_retries:
+                raise
+            error = e
+        else:
+            if not response["success"]:
+                raise RuntimeError(f"Call to {resource_id} failed: {response.get('error')}")
+            response["result"]["records"] = columns
             return response
-        elif response["success"] == False:
-            print("Call failed")
-    except Exception as e:
-        print(f"Error occurred: {e}")
-        print(e)
-        print(url_string)
+        delay = backoff_delay(attempt, retry_after)
+        print(f"Call to {resource_id} at offset {offset:,} failed ({error}), retrying in {delay:.1f}s")
+        time.sleep(delay)
+
+
+def read_state() -> dict:
+    if not os.path.exists(state_path):
+        return {}
+    with open(state_path) as file:
+        return json.load(file)
+
+
+def write_state(state: dict):
+    tmp_path = f"{state_path}.tmp-{os.getpid()}"
+    with open(tmp_path, "w") as file:
+        json.dump(state, file, indent=2)
+    os.replace(tmp_path, state_path)
 
 
-def get_data():
+def probe_resource(resource_id: str, state: dict) -> dict:
+    """
+    One-record conditional call to check whether a resource changed since the last sync.
+
+    Returns None when it is unchanged, either because the server answered 304 or because
+    the record total matches, otherwise the validators and total to store after syncing.
+    """
+    previous = state.get(resource_id)
+    body = retrieve_data(resource_id, 1, validators=previous)
+    if body is None:
+        return None
+    current = dict(body["validators"], total=body["result"]["total"])
+    if previous is not None and previous.get("total") == current["total"]:
+        return None
+    return current
+
+
+def get_paginated_data(resource_id: str, total: int) -> pd.DataFrame:
+    """
+    Split a resource into offset/limit pages and pull them through a bounded worker pool.
+
+    Each page is parsed into column buffers as it streams in, and all pages share
+    one table of interned text values.
+    """
+    offsets = range(0, total, page_size)
+    pages = [None] * len(offsets)
+    strings = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(retrieve_data, resource_id, page_size, offset, None, strings): i
+            for i, offset in enumerate(offsets)
+        }
+        for future in as_completed(futures):
+            body = future.result()
+            pages[futures[future]] = body["result"]["records"]
+            print(f"Page {futures[future] + 1}/{len(pages)} of {resource_id} retrieved")
+    return concat_pages(pages)
+
+
+def get_data(paginated: bool = True, strict: bool = False, state: dict = None):
+    """
+    Fetch every record of every resource. A failed resource is skipped with a message,
+    unless `strict` is set, in which case the error is raised instead of returning partial data.
+
+    When a sync `state` is given, the validators and total of each resource fetched are
+    recorded in it, so the next incremental fetch can probe for changes.
+    """
     print("Fetching data")
     content = pd.DataFrame()
     for resource_id in resource_ids:
-        time.sleep(1)
         try:
             print(f"First call to {resource_id}")
             body = retrieve_data(resource_id, 1)
             limit = body["result"]["total"]
-            print(f"Second call, retrieving {limit:,} records")
-            body = retrieve_data(resource_id, limit)
-            resource_df = pd.DataFrame(body["result"]["records"])
+            current = dict(body["validators"], total=limit)
+            if paginated:
+                print(f"Retrieving {limit:,} records in pages of {page_size:,}")
+                resource_df = get_paginated_data(resource_id, limit)
+            else:
+                print(f"Second call, retrieving {limit:,} records")
+                body = retrieve_data(resource_id, limit)
+                resource_df = pd.DataFrame(body["result"]["records"])
             content = pd.concat([content, resource_df], ignore_index=True)
-        except:
+            if state is not None:
+                state[resource_id] = current
+        except Exception:
             print(f"Error: {resource_id} unsuccessful")
+            if strict:
+                raise
     print(f"Retrieval complete! {content.shape[0]:,} records retrieved.")
     return content
 
 
+def get_resource_since(resource_id: str, watermark: str) -> pd.DataFrame:
+    """
+    Page through a resource newest-first and stop once records fall before the watermark.
+
+    Sorting on _id as well keeps the paging stable between calls, since many records share a month.
+    """
+    pages = []
+    strings = {}
+    offset = 0
+    while True:
+        body = retrieve_data(resource_id, page_size, offset, sort="month desc,_id desc", strings=strings)
+        page = body["result"]["records"]
+        if not page:
+            break
+        pages.append(page)
+        offset += page_size
+        if page["month"][-1] < watermark or offset >= body["result"]["total"]:
+            break
+    resource_df = concat_pages(pages)
+    if resource_df.empty:
+        return resource_df
+    return resource_df[resource_df["month"] >= watermark]
+
+
+def get_data_since(watermark: str, strict: bool = False) -> tuple:
+    """
+    Fetch only records from the watermark month onwards.
+
+    The watermark month itself is fetched again as it may have been only partially published
+    when the snapshot was last written, so callers should replace their rows for that month.
+    With `strict` set, a failed resource raises rather than being skipped.
+
+    Returns the records and the sync state (validators and totals) that describes them. The
+    state is not written here: callers pass it to `write_state` once the records are safely
+    stored, otherwise a failed write would make the next probe skip records never stored.
+    """
+    state = read_state()
+    if watermark is None:
+        return get_data(strict=strict, state=state), state
+    print(f"Fetching records from {watermark} onwards")
+    content = pd.DataFrame()
+    for resource_id in resource_ids:
+        try:
+            current = probe_resource(resource_id, state)
+            if current is None:
+                print(f"{resource_id} unchanged since last sync")
+                continue
+            resource_df = get_resource_since(resource_id, watermark)
+            content = pd.concat([content, resource_df], ignore_index=True)
+            state[resource_id] = current
+        except Exception:
+            print(f"Error: {resource_id} unsuccessful")
+            if strict:
+                raise
+    print(f"Retrieval complete! {content.shape[0]:,} records retrieved.")
+    return content, state
+
+
+coords_path = path + "/assets/hdb_coords.csv"
+boundary_path = path + "/assets/master-plan-2014-planning-area-boundary-no-sea.json"
+
+
 def get_coords_df():
     return pd.read_csv(
-        path+"/assets/hdb_coords.csv",
+        coords_path,
         index_col="address"
     )
 
 
-def get_chloropeth():
-    with open(
-        path+"/assets/master-plan-2014-planning-area-boundary-no-sea.json"
-    ) as f:
+def get_boundary_path(level: str = None) -> str:
+    if level is None:
+        return boundary_path
+    return path + f"/assets/planning-area-boundary-{level}.json"
+
+
+def get_chloropeth(level: str = None):
+    """
+    Planning area boundaries, either the full Master Plan file or a simplified level
+    built by `python build.py boundaries`, falling back to the full file if it is missing.
+    """
+    file_path = get_boundary_path(level)
+    if not os.path.exists(file_path):
+        file_path = boundary_path
+    with open(file_path) as f:
         return json.load(f)
@@ -0,0 +1,60 @@
+import threading
+from collections import OrderedDict
+import plotly.io as pio
+
+"""
+Process-wide LRU cache of serialized Plotly figures, bounded by total size in bytes.
+"""
+
+
+class FigureCache:
+    """
+    Figures are stored as JSON keyed by whatever identifies them (figure name, filters and
+    dataset version). Once the stored JSON exceeds `max_bytes`, the least recently used
+    figures are evicted. Safe to share between Streamlit sessions.
+    """
+
+    def __init__(self, max_bytes: int = 64_000_000):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get_or_build(self, key: tuple, build):
+        with self.lock:
+            serialized = self.entries.get(key)
+            if serialized is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+        if serialized is not None:
+            return pio.from_json(serialized)
+
+        figure = build()
+        serialized = figure.to_json()
+        with self.lock:
+            self.misses += 1
+            if len(serialized) > self.max_bytes:
+                return figure
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.bytes -= len(previous)
+            self.entries[key] = serialized
+            self.bytes += len(serialized)
+            while self.bytes > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.bytes -= len(evicted)
+                self.evictions += 1
+        return figure
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self.entries),
+                "bytes": self.bytes,
+            }
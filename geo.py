@@ -0,0 +1,163 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+import shapely
+import shapely.geometry
+import fetch as f
+import store
+
+"""
+Helper functions to map HDB addresses onto the Master Plan 2014 planning areas.
+"""
+
+path = os.path.dirname(__file__)
+lookup_path = path + "/assets/hdb_town_lookup.csv"
+lookup_meta_path = path + "/assets/hdb_town_lookup.json"
+lookup_version = 2  # bump when the geometry join changes, to rebuild stored lookups
+# simplification tolerances (degrees) for the map boundaries, "medium" is about 55m
+boundary_levels = {"fine": 0.0001, "medium": 0.0005, "coarse": 0.001}
+
+
+def get_planning_areas(geo_df: dict) -> tuple:
+    """
+    Planning area names and their full boundaries, prepared for repeated containment tests.
+
+    Boundaries are built from the whole GeoJSON geometry, so MultiPolygon areas keep all
+    of their parts and interior rings stay as holes.
+    """
+    planning_areas = []
+    polygons = []
+    for feature in geo_df["features"]:
+        planning_areas.append(feature["properties"]["PLN_AREA_N"])
+        polygons.append(shapely.geometry.shape(feature["geometry"]))
+    polygons = np.array(polygons, dtype=object)
+    shapely.prepare(polygons)
+    return planning_areas, polygons
+
+
+def assign_planning_areas(latitudes, longitudes, planning_areas: list, polygons: list) -> np.ndarray:
+    """
+    Bulk point-in-polygon join of coordinates onto planning areas.
+
+    Candidate polygons come from an STRtree over the prepared polygons, so each point is
+    only tested against the few areas whose bounding boxes cover it. Points outside every
+    area (or without coordinates) are left as None. Where areas overlap, the first listed wins,
+    as with a linear scan.
+    """
+    longitudes = np.asarray(longitudes, dtype=float)
+    latitudes = np.asarray(latitudes, dtype=float)
+    # points outside the combined bounding box of every area can't match anything
+    min_x, min_y, max_x, max_y = shapely.total_bounds(polygons)
+    candidates = np.flatnonzero(
+        (longitudes >= min_x) & (longitudes <= max_x) & (latitudes >= min_y) & (latitudes <= max_y)
+    )
+    points = shapely.points(longitudes[candidates], latitudes[candidates])
+    # preparing is a no-op for polygons that are already prepared, but is lost when they are unpickled
+    shapely.prepare(polygons)
+    tree = shapely.STRtree(polygons)
+    point_idx, polygon_idx = tree.query(points, predicate="within")
+    point_idx = candidates[point_idx]
+    # keep the lowest polygon index per point by writing matches in descending order
+    order = np.argsort(polygon_idx, kind="stable")[::-1]
+    assigned = np.full(len(longitudes), -1)
+    assigned[point_idx[order]] = polygon_idx[order]
+    names = np.array(list(planning_areas) + [None], dtype=object)
+    return names[assigned]
+
+
+def find_unique_locations(addresses, hdb_coordinates: pd.DataFrame, planning_areas: list, polygons: list) -> dict:
+    """
+    Map each unique address to the planning area its coordinates fall in.
+    """
+    addresses = pd.unique(np.asarray(addresses, dtype=object))
+    coords = hdb_coordinates.reindex(addresses)
+    towns = assign_planning_areas(coords["latitude"], coords["longitude"], planning_areas, polygons)
+    return dict(zip(addresses, towns))
+
+
+def read_town_lookup() -> tuple:
+    if not os.path.exists(lookup_path) or not os.path.exists(lookup_meta_path):
+        return pd.DataFrame(columns=["latitude", "longitude", "town"]), {}
+    with open(lookup_meta_path) as file:
+        meta = json.load(file)
+    return pd.read_csv(lookup_path, index_col="address"), meta
+
+
+def write_town_lookup(lookup: pd.DataFrame, meta: dict):
+    tmp_path = f"{lookup_path}.tmp-{os.getpid()}"
+    lookup.to_csv(tmp_path, index_label="address")
+    os.replace(tmp_path, lookup_path)
+    tmp_path = f"{lookup_meta_path}.tmp-{os.getpid()}"
+    with open(tmp_path, "w") as file:
+        json.dump(meta, file, indent=2)
+    os.replace(tmp_path, lookup_meta_path)
+
+
+def get_town_lookup(hdb_coordinates: pd.DataFrame, planning_areas: list, polygons: list) -> pd.Series:
+    """
+    Address -> planning area lookup, persisted next to hdb_coords.csv.
+
+    The stored table is reused as long as the hashes of the coordinates file and the
+    boundary GeoJSON match. A new boundary file invalidates every row, while a changed
+    coordinates file only sends new or moved addresses through the geometry join.
+    """
+    meta = {
+        "version": lookup_version,
+        "coords_sha256": store.file_checksum(f.coords_path),
+        "boundary_sha256": store.file_checksum(f.boundary_path),
+    }
+    lookup, stored_meta = read_town_lookup()
+    if stored_meta == meta:
+        return lookup["town"]
+    if stored_meta.get("boundary_sha256") != meta["boundary_sha256"] or stored_meta.get("version") != lookup_version:
+        lookup = lookup.iloc[0:0]
+
+    coords = hdb_coordinates[["latitude", "longitude"]]
+    coords = coords[~coords.index.duplicated()]
+    stored = lookup.reindex(coords.index)
+    stale = ~np.isclose(stored["latitude"], coords["latitude"]) | ~np.isclose(stored["longitude"], coords["longitude"])
+    print(f"Assigning planning areas to {stale.sum():,} new or moved addresses")
+    towns = stored["town"].astype(object)
+    if stale.any():
+        stale_coords = coords[stale]
+        towns[stale] = assign_planning_areas(stale_coords["latitude"], stale_coords["longitude"], planning_areas, polygons)
+    lookup = coords.assign(town=towns)
+    write_town_lookup(lookup, meta)
+    return lookup["town"]
+
+
+def simplify_boundaries(geo_df: dict, tolerance: float) -> dict:
+    """
+    Topology-preserving simplification of the planning area boundaries for map payloads.
+
+    Coordinates are snapped to a grid a tenth of the tolerance and rounded to match, and only
+    the PLN_AREA_N property used as the map's featureidkey is kept. Each area is simplified
+    on its own, so shared borders may drift apart by up to the tolerance, which stays below
+    a pixel at the dashboard's zoom for the medium level.
+    """
+    grid_size = tolerance / 10
+    decimals = int(np.ceil(-np.log10(grid_size)))
+    features = []
+    for feature in geo_df["features"]:
+        geometry = shapely.geometry.shape(feature["geometry"])
+        geometry = shapely.simplify(geometry, tolerance, preserve_topology=True)
+        geometry = shapely.set_precision(geometry, grid_size)
+        geometry = shapely.transform(geometry, lambda coords: np.round(coords, decimals))
+        features.append({
+            "type": "Feature",
+            "properties": {"PLN_AREA_N": feature["properties"]["PLN_AREA_N"]},
+            "geometry": shapely.geometry.mapping(geometry),
+        })
+    return {"type": "FeatureCollection", "features": features}
+
+
+def write_simplified_boundaries(geo_df: dict, levels: dict = None):
+    for level, tolerance in (levels or boundary_levels).items():
+        simplified = simplify_boundaries(geo_df, tolerance)
+        file_path = f.get_boundary_path(level)
+        tmp_path = file_path + ".tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(simplified, file, separators=(",", ":"))
+        os.replace(tmp_path, file_path)
+        print(f"{level} boundaries ({tolerance}): {os.path.getsize(file_path) / 1e3:,.0f} kB")
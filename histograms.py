@@ -0,0 +1,98 @@
+from dataclasses import dataclass
+import numpy as np
+import pandas as pd
+
+"""
+Histogram bin counts for the EDA distributions, built once per dataset version so the
+Plotly and Altair charts carry a few thousand bins instead of every transaction.
+"""
+
+price_bins = 200
+floor_area_step = 5
+
+
+@dataclass(frozen=True)
+class Histograms:
+    """
+    Long tables of (group columns..., bin_start, bin_end, count), nonzero bins only.
+    resale_price is counted per year and flat_type over `price_bins` equal-width bins,
+    remaining_lease per year over 1-year bins, and floor_area_sqm per flat_type over
+    `floor_area_step` sqm bins.
+    """
+    resale_price: pd.DataFrame
+    remaining_lease: pd.DataFrame
+    floor_area: pd.DataFrame
+
+
+def bin_counts(df: pd.DataFrame, column: str, edges: np.ndarray, by: list) -> pd.DataFrame:
+    """
+    Transactions per combination of the `by` columns and bin of `column`, with bins
+    [edges[i], edges[i + 1]) and the last bin closed on the right.
+    """
+    bins = np.clip(np.searchsorted(edges, df[column].to_numpy(), side="right") - 1, 0, len(edges) - 2)
+    keys = [df[key].astype("category") for key in by]
+    codes = [key.cat.codes.to_numpy() for key in keys]
+    shape = [len(key.cat.categories) for key in keys] + [len(edges) - 1]
+    keep = np.logical_and.reduce([code >= 0 for code in codes]) if codes else slice(None)
+    cells = np.ravel_multi_index([code[keep] for code in codes] + [bins[keep]], shape)
+    counts = np.bincount(cells, minlength=int(np.prod(shape)))
+    nonzero = np.flatnonzero(counts)
+    positions = np.unravel_index(nonzero, shape)
+    result = pd.DataFrame({
+        name: key.cat.categories[position]
+        for name, key, position in zip(by, keys, positions)
+    })
+    result["bin_start"] = edges[positions[-1]]
+    result["bin_end"] = edges[positions[-1] + 1]
+    result["count"] = counts[nonzero]
+    return result
+
+
+def build_histograms(df: pd.DataFrame) -> Histograms:
+    price_edges = np.linspace(df["resale_price"].min(), df["resale_price"].max(), price_bins + 1)
+    lease_edges = np.arange(df["remaining_lease"].min(), df["remaining_lease"].max() + 2)
+    area_start = df["floor_area_sqm"].min() // floor_area_step * floor_area_step
+    area_edges = np.arange(area_start, df["floor_area_sqm"].max() + floor_area_step + 1, floor_area_step)
+    return Histograms(
+        resale_price=bin_counts(df, "resale_price", price_edges, ["year", "flat_type"]),
+        remaining_lease=bin_counts(df, "remaining_lease", lease_edges, ["year"]),
+        floor_area=bin_counts(df, "floor_area_sqm", area_edges, ["flat_type"]),
+    )
+
+
+@dataclass(frozen=True)
+class ChartTables:
+    """
+    The histograms as the EDA page charts them. floor_area_df merges EXECUTIVE and
+    MULTI-GENERATION into EXECUTIVE*, flat_type_df totals it per flat type, price_counts
+    carries bin midpoints as resale_price (price_counts_total summed over years), and
+    lease_counts totals remaining lease over years with each bin's percent.
+    """
+    floor_area_df: pd.DataFrame
+    flat_type_df: pd.DataFrame
+    price_counts: pd.DataFrame
+    price_counts_total: pd.DataFrame
+    price_bin_width: float
+    lease_counts: pd.DataFrame
+
+
+def chart_tables(histograms: Histograms) -> ChartTables:
+    floor_area_df = histograms.floor_area.copy()
+    floor_area_df["flat_type"] = floor_area_df["flat_type"].astype(str).replace({"MULTI-GENERATION": "EXECUTIVE*", "EXECUTIVE": "EXECUTIVE*"})
+    floor_area_df = floor_area_df.groupby(["flat_type", "bin_start", "bin_end"], as_index=False)["count"].sum()
+
+    price_counts = histograms.resale_price
+    price_bin_width = price_counts["bin_end"].iloc[0] - price_counts["bin_start"].iloc[0]
+    price_counts = price_counts.assign(resale_price=(price_counts["bin_start"] + price_counts["bin_end"]) / 2)
+
+    lease_counts = histograms.remaining_lease.groupby("bin_start", as_index=False)["count"].sum()
+    lease_counts["remaining_lease"] = lease_counts["bin_start"]
+    lease_counts["percent"] = lease_counts["count"] / lease_counts["count"].sum() * 100
+    return ChartTables(
+        floor_area_df=floor_area_df,
+        flat_type_df=floor_area_df.groupby("flat_type", as_index=False)["count"].sum(),
+        price_counts=price_counts,
+        price_counts_total=price_counts.groupby(["flat_type", "resale_price"], as_index=False)["count"].sum(),
+        price_bin_width=price_bin_width,
+        lease_counts=lease_counts,
+    )
@@ -0,0 +1,123 @@
+from dataclasses import dataclass
+import numpy as np
+import pandas as pd
+
+"""
+Row indexes over the transformed dataset, built once per dataset version so filters
+resolve to row positions without scanning every transaction.
+"""
+
+
+@dataclass(frozen=True)
+class FilterIndex:
+    """
+    Rows are expected in date order, so each year is the contiguous range
+    year_starts[i]:year_starts[i + 1]. town_rows holds the sorted row positions of each town.
+    """
+    years: np.ndarray
+    year_starts: np.ndarray
+    town_rows: dict
+
+
+def build_filter_index(df: pd.DataFrame) -> FilterIndex:
+    years = df["date"].dt.year.to_numpy()
+    if np.any(np.diff(years) < 0):
+        raise ValueError("Filter index needs the dataset in date order")
+    unique_years, year_starts = np.unique(years, return_index=True)
+
+    towns = df["town"].astype("category")
+    codes = towns.cat.codes.to_numpy()
+    order = np.argsort(codes, kind="stable").astype("int32")
+    bounds = np.searchsorted(codes[order], np.arange(len(towns.cat.categories) + 1))
+    town_rows = {
+        town: order[bounds[i]:bounds[i + 1]]
+        for i, town in enumerate(towns.cat.categories)
+    }
+    return FilterIndex(
+        years=unique_years,
+        year_starts=np.append(year_starts, len(years)),
+        town_rows=town_rows,
+    )
+
+
+def year_range(index: FilterIndex, year: int) -> tuple:
+    i = np.searchsorted(index.years, year)
+    if i == len(index.years) or index.years[i] != year:
+        return 0, 0
+    return index.year_starts[i], index.year_starts[i + 1]
+
+
+def filter_rows(index: FilterIndex, town: str = None, year: int = None):
+    """
+    Row positions for an exact town and a year, either of which may be None for all.
+    Returns a slice when the rows are contiguous, otherwise a sorted position array.
+    """
+    if town is None:
+        if year is None:
+            return slice(None)
+        start, end = year_range(index, year)
+        return slice(start, end)
+    rows = index.town_rows.get(town, np.array([], dtype="int32"))
+    if year is None:
+        return rows
+    start, end = year_range(index, year)
+    return rows[np.searchsorted(rows, start):np.searchsorted(rows, end)]
+
+
+@dataclass(frozen=True)
+class PriceIndex:
+    """
+    Row positions sorted by (town, year, resale_price), with `keys` holding each row's
+    group (town code * number of years + year offset, town code 0 for rows without a town)
+    in the upper 32 bits and its price in the lower 32. The rows of a group at or above a
+    price are then a binary search and a slice.
+    """
+    towns: pd.Index
+    first_year: int
+    n_years: int
+    keys: np.ndarray
+    rows: np.ndarray
+
+
+def build_price_index(df: pd.DataFrame) -> PriceIndex:
+    towns = df["town"].astype("category")
+    town_codes = towns.cat.codes.to_numpy().astype("int64") + 1
+    years = df["date"].dt.year.to_numpy()
+    first_year = int(years.min())
+    n_years = int(years.max()) - first_year + 1
+    groups = town_codes * n_years + (years - first_year)
+    keys = (groups << 32) | df["resale_price"].to_numpy().astype("int64")
+    order = np.argsort(keys, kind="stable")
+    return PriceIndex(
+        towns=towns.cat.categories,
+        first_year=first_year,
+        n_years=n_years,
+        keys=keys[order],
+        rows=order.astype("int32"),
+    )
+
+
+def rows_above(index: PriceIndex, threshold: int, town: str = None, year: int = None) -> np.ndarray:
+    """
+    Sorted row positions priced at or above `threshold` for an exact town and a year,
+    either of which may be None for all.
+    """
+    if town is None:
+        town_codes = np.arange(len(index.towns) + 1)
+    elif town in index.towns:
+        town_codes = np.array([index.towns.get_loc(town) + 1])
+    else:
+        town_codes = np.array([], dtype="int64")
+    if year is None:
+        year_offsets = np.arange(index.n_years)
+    elif 0 <= year - index.first_year < index.n_years:
+        year_offsets = np.array([year - index.first_year])
+    else:
+        year_offsets = np.array([], dtype="int64")
+    groups = (town_codes[:, None] * index.n_years + year_offsets[None, :]).ravel().astype("int64")
+    starts = np.searchsorted(index.keys, (groups << 32) + threshold)
+    ends = np.searchsorted(index.keys, (groups + 1) << 32)
+    lengths = ends - starts
+    # gather the slices in one pass rather than concatenating one array per group
+    offsets = np.repeat(starts - np.concatenate([[0], np.cumsum(lengths)[:-1]]), lengths)
+    return np.sort(index.rows[offsets + np.arange(lengths.sum())])
@@ -1,8 +1,9 @@
 import pandas as pd
 import streamlit as st
-import plotly.express as px
-import altair as alt
-from streamlit_extras.switch_page_button import switch_page
+import aggregates
+import charts
+import dataset
+import histograms
 
 st.set_page_config(
     page_title="HDB Resale Price Dashboard",
@@ -15,148 +16,41 @@ st.set_page_config(
         }
     )
 
-def add_marker(base_chart, nearest, tooltip_y_val:str, tooltip_y_title:str, tooltip_y_format:str):
-    '''
-    Adds a selector indicator and rule to altair chart
-    '''
-    # selectors that tell us the x-value of the cursor
-    selector = (
-        base_chart.mark_point(color="red")
-        .encode(
-            x="date",
-            opacity=alt.condition(nearest, alt.value(1), alt.value(0)),
-            tooltip=[
-                alt.Tooltip("date", title="Transaction Period", format="%b-%y"),
-                alt.Tooltip(
-                    tooltip_y_val, title=tooltip_y_title, format=tooltip_y_format
-                ),
-            ]
-        )
-        .add_selection(nearest)
-    )
-
-    # draw a rule at location of selection
-    rule = (
-        base_chart.mark_rule(color="gray")
-        .encode(x="date")
-        .transform_filter(nearest)
-    )
+# shared by all sessions, loaded on first use if this page is opened directly
+data = dataset.get_dataset()
 
-    return selector, rule
+# histograms are plotted from bin counts built once per dataset version, not from every transaction
+tables = histograms.chart_tables(data.histograms)
 
-# return to home to fetch data 
-if "df" not in st.session_state or "df_raw" not in st.session_state:
-    switch_page("Home")
-
-# flat type distribution
-flat_type_df = st.session_state.df[["flat_type", "floor_area_sqm"]].copy()
-flat_type_df["flat_type"] = flat_type_df["flat_type"].replace({"MULTI-GENERATION": "EXECUTIVE*", "EXECUTIVE": "EXECUTIVE*"})
+with st.sidebar:
+    exact_medians = st.checkbox(
+        label="Exact medians",
+        help="Compute medians from every transaction instead of merging price sketches (within 1%), for auditing"
+    )
 
-with pd.option_context("display.float_format", "${:,.2f}".format):
-    resale_price_table = st.session_state.df.groupby(["town", "flat_type"]).resale_price.median().reset_index()
-    resale_price_pivot = pd.pivot(resale_price_table, index="town", columns="flat_type", values="resale_price")
+# median prices are merged from the cube's sketches unless exact medians are requested
+resale_price_table = aggregates.rollup(
+    data.cube, ["town", "flat_type"], exact_rows=data.df if exact_medians else None
+)[["town", "flat_type", "resale_price"]]
+resale_price_pivot = pd.pivot(resale_price_table, index="town", columns="flat_type", values="resale_price")
 resale_table_columns = ["1 ROOM", "2 ROOM", "3 ROOM", "4 ROOM", "5 ROOM", "EXECUTIVE", "MULTI-GENERATION"]
 
 flat_order = {
     "flat_type": resale_table_columns
 }
 
-resale_plot = px.histogram(
-    st.session_state.df.sort_values(by="year"),
-    x="resale_price",
-    color="flat_type",
-    opacity=0.8,
-    nbins=200,
-    barmode="overlay",
-    title="Distribution of Resale Price",
-    category_orders=flat_order
-).update_layout(
-    xaxis_title="Resale Price (S$)",
-    yaxis_title="Frequency",
-    height=450,
-    legend={
-        "orientation": "h",
-        "y": 1.12,
-        "x": 0.2,
-        "title": None
-    }
-)
+resale_plot = charts.resale_price_histogram(tables.price_counts_total, tables.price_bin_width, flat_order)
+resale_plot_animated = charts.resale_price_histogram_animated(tables.price_counts, tables.price_bin_width, flat_order)
+remaining_lease_plot = charts.remaining_lease_histogram(tables.lease_counts)
 
-resale_plot_animated = px.histogram(
-    st.session_state.df.sort_values(by="year"),
-    x="resale_price",
-    animation_frame="year",
-    color="flat_type",
-    range_x=[st.session_state.df.resale_price.min(), st.session_state.df.resale_price.max()],
-    range_y=[0, 1500],
-    title="Distribution of Resale Price by Year",
-    opacity=0.8,
-    barmode="overlay",
-    category_orders=flat_order
-).update_layout(
-    xaxis_title="Resale Price (S$)",
-    yaxis_title="Frequency",
-    height=550,
-    legend={
-        "orientation": "h",
-        "y": 1.12,
-        "x": 0.2,
-        "title": None
-    }
-)
+# size of the serialized histogram figures sent to the browser, measured once per dataset version
+@st.cache_data(show_spinner=False, max_entries=1)
+def get_histogram_payload(version: str, _plots: list) -> int:
+    return sum(len(plot.to_json()) for plot in _plots)
 
-remaining_lease_plot = px.histogram(
-    st.session_state.df.sort_values(by="year"),
-    x="remaining_lease",
-    opacity=0.8,
-    title="Distribution of Remaining Lease (Years)",
-    color_discrete_sequence=['dodgerblue'],
-    histnorm="percent"
-).update_layout(
-    xaxis_title="Remaining Lease",
-    yaxis_title="Frequency",
-    height=450,
-)
+histogram_payload = get_histogram_payload(data.version, [resale_plot, resale_plot_animated, remaining_lease_plot])
 
-flat_type_selector = alt.selection_multi(empty="all", fields=["flat_type"])
-
-flat_base = alt.Chart(
-    flat_type_df,
-).add_selection(flat_type_selector)
-
-flat_type_plot = (
-    flat_base.mark_bar()
-    .encode(
-        alt.X("count()", axis=alt.Axis(title="Transactions")),
-        alt.Y("flat_type:N", axis=alt.Axis(title="Flat Type")),
-        color=alt.condition(
-            flat_type_selector, "flat_type:N", alt.value("lightgray"), legend=None
-        ),
-        tooltip=[
-            alt.Tooltip("flat_type", title="Flat Type"),
-            alt.Tooltip("count()", title="Transactions", format=","),
-        ],
-    )
-    .properties(height=250, title="Transactions by Flat Type")
-)
-
-floor_area_plot = (
-    flat_base.mark_bar(opacity=0.8, binSpacing=0)
-    .encode(
-        alt.X(
-            "floor_area_sqm:Q",
-            bin=alt.Bin(step=5),
-            axis=alt.Axis(title="Floor Area (sqm)"),
-        ),
-        alt.Y("count()", stack=None, axis=alt.Axis(title="Count")),
-        alt.Color("flat_type:N", legend=None),
-    )
-    .transform_filter(flat_type_selector)
-    .properties(
-        height=250,
-        title="Distribution of Floor Area by Flat Type"
-    )
-)
+flat_type_plots = charts.flat_type_charts(tables.flat_type_df, tables.floor_area_df)
 
 with st.sidebar:
     st.markdown(
@@ -175,7 +69,7 @@ with st.container():
     st.markdown(
         "We utilise the Data.gov.sg API to extract our required data. Let's check out the dataset to see what it includes."
     )
-    st.dataframe(st.session_state.df_raw.head(3), use_container_width=True)
+    st.dataframe(data.df_raw.head(3), use_container_width=True)
     st.markdown(
         """
         The dataset provides key information regarding the resale transactions since 2012, including location, flat type and lease information. The information 
@@ -189,8 +83,9 @@ with st.container():
         """
     )
     st.markdown(
-        f"Checking the shape of the dataframe, we currently have `{st.session_state.df.shape[0]:,}` rows, each of which represents a unique resale transaction."
+        f"Checking the shape of the dataframe, we currently have `{data.df.shape[0]:,}` rows, each of which represents a unique resale transaction."
     )
+    st.caption(dataset.refresh_summary())
 
 st.markdown("---")
 
@@ -206,7 +101,7 @@ with st.container():
         Checking out the new dataframe after transformation:
         """
     )
-    st.dataframe(st.session_state.df.head(3), use_container_width=True)
+    st.dataframe(data.df.head(3), use_container_width=True)
 
 st.markdown("---")
 
@@ -253,6 +148,7 @@ with resale_tab_animated:
 
 with st.container():
     st.plotly_chart(remaining_lease_plot, use_container_width=True)
+    st.caption(f"Histogram figures: {histogram_payload / 1e3:,.0f} kB sent to the browser")
     st.markdown(
         """
         Given the 99-year leases for HDB flats, it should be unsurprising to see a spike in transactions for flats with over 90 years lease remaining.
@@ -267,6 +163,6 @@ with st.container():
 with st.container():
     st.markdown("Click to filter by flat types, hold shift to select multiple options.")
     # use_container_width currently does not seem to work for concatenated charts
-    st.altair_chart(flat_type_plot | floor_area_plot, use_container_width=True)
+    st.altair_chart(flat_type_plots, use_container_width=True)
     st.markdown("\* Includes Multi-Generation flats")
     st.markdown("---")
\ No newline at end of file
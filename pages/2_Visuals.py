@@ -1,9 +1,10 @@
-import pandas as pd
 import streamlit as st
-import altair as alt
-import plotly.express as px
 from decimal import Decimal
-from streamlit_extras.switch_page_button import switch_page
+import aggregates
+import charts
+import dataset
+import figcache
+import fetch as f
 
 st.set_page_config(
     page_title="HDB Resale Price Dashboard",
@@ -15,43 +16,46 @@ st.set_page_config(
         "About": "Thanks for dropping by!"
         }
     )
-    
-alt.data_transformers.enable("json")
 
-# return to home to fetch data 
-if "df" not in st.session_state:
-    switch_page("Home")
+# shared by all sessions, loaded on first use if this page is opened directly
+data = dataset.get_dataset()
 
-towns = st.session_state.df["town"].unique()
+# simplified boundaries are plenty at the map's zoom and a fraction of the full file's payload
+map_boundary_level = "medium"
+
+@st.cache_data(show_spinner=False)
+def get_map_boundaries(level: str) -> dict:
+    return f.get_chloropeth(level)
+
+map_geo_df = get_map_boundaries(map_boundary_level)
+
+# rendered figures are shared by all sessions, keyed by filters and dataset version
+@st.cache_resource
+def get_figure_cache() -> figcache.FigureCache:
+    return figcache.FigureCache(max_bytes=64_000_000)
+
+figure_cache = get_figure_cache()
+
+towns = data.df["town"].unique()
 towns = sorted(towns)
 towns.insert(0, "All Towns")
 
-years = list(st.session_state.df["year"].unique())
+years = list(data.df["year"].unique())
 years = sorted(years, reverse=True)
 years.insert(0, "All Years")
 
 
-def get_scale(series: pd.Series) -> list[int, int]:
-    scale_min = int(series.min() * 0.9)
-    scale_max = int(series.max() * 1.1)
-    return [scale_min, scale_max]
-
-
-def get_delta(var:str, type:str) -> str:
-    if year_option != "All Years" and year_option != years[-1]:
-        if type == "count":
-            delta = (df_filtered[var].count() - df_filtered_previous_year[var].count())
-        elif type == "sum":
-            delta = (df_filtered[var].sum() - df_filtered_previous_year[var].sum())
-        elif type == "min":
-            delta = (df_filtered[var].min() - df_filtered_previous_year[var].min())
-        elif type == "max":
-            delta = (df_filtered[var].max() - df_filtered_previous_year[var].max())
-        elif type == "median":
-            delta = (df_filtered[var].median() - df_filtered_previous_year[var].median())
-        return f"{numerize(delta)} vs {year_option-1}"
+def get_delta(stat: str) -> str:
+    if metrics["delta"] is not None:
+        return f"{numerize(metrics['delta'][stat])} vs {year_option-1}"
     return None
 
+
+def get_value(stat: str, format) -> str:
+    if metrics["current"] is None:
+        return "-"
+    return format(metrics["current"][stat])
+
 def round_num(n, decimals):
     return n.to_integral() if n == n.to_integral() else round(n.normalize(), decimals)
 
@@ -94,36 +98,6 @@ def numerize(n, decimals=2):
         return is_negative_string + f"{n:,}"
 
 
-def add_marker(base_chart, nearest, tooltip_y_val:str, tooltip_y_title:str, tooltip_y_format:str):
-    '''
-    Adds a selector indicator and rule to altair chart
-    '''
-    # selectors that tell us the x-value of the cursor
-    selector = (
-        base_chart.mark_point(color="red")
-        .encode(
-            x="date",
-            opacity=alt.condition(nearest, alt.value(1), alt.value(0)),
-            tooltip=[
-                alt.Tooltip("date", title="Transaction Period", format="%b-%y"),
-                alt.Tooltip(
-                    tooltip_y_val, title=tooltip_y_title, format=tooltip_y_format
-                ),
-            ]
-        )
-        .add_selection(nearest)
-    )
-
-    # draw a rule at location of selection
-    rule = (
-        base_chart.mark_rule(color="gray")
-        .encode(x="date")
-        .transform_filter(nearest)
-    )
-
-    return selector, rule
-
-
 # sidebar for filtering dashboard
 with st.sidebar:
     st.header("Filter options")
@@ -131,6 +105,19 @@ with st.sidebar:
 
     year_option = st.selectbox(label="Year", options=years)
 
+    price_threshold = st.select_slider(
+        label="Price threshold",
+        options=[500_000, 750_000, 1_000_000, 1_250_000, 1_500_000],
+        value=1_000_000,
+        format_func=lambda n: f"S${numerize(n)}",
+        help="Transactions at or above this price are starred on the map and listed separately"
+    )
+
+    exact_medians = st.checkbox(
+        label="Exact medians",
+        help="Compute medians from every transaction instead of merging price sketches (within 1%), for auditing"
+    )
+
     st.markdown(
         """
         ---
@@ -142,378 +129,39 @@ with st.sidebar:
         """
         )
 
-# filter df based on selected parameters
-if town_option == "All Towns":
-    if year_option == "All Years":
-        df_filtered = st.session_state.df
-    else:
-        df_filtered = st.session_state.df.query("date.dt.year == @year_option")
-        df_filtered_previous_year = st.session_state.df.query(
-            "date.dt.year == @year_option-1"
-        )
-else:
-    if year_option == "All Years":
-        df_filtered = st.session_state.df.query("town.str.contains(@town_option)")
-    else:
-        df_filtered = st.session_state.df.query(
-            "date.dt.year == @year_option & town.str.contains(@town_option)"
-        )
-        df_filtered_previous_year = st.session_state.df.query(
-            "date.dt.year == @year_option-1 & town.str.contains(@town_option)"
-        )
-
-# median price choropleth
-choropleth_df = (df_filtered
-                    .groupby("town")
-                    .agg(
-                        transactions=("resale_price", "count"), 
-                        resale_price=("resale_price", "median"), 
-                        remaining_lease=("remaining_lease", "median"))
-                    .reset_index())
-choropleth_df["age"] = 99 - choropleth_df["remaining_lease"]
-# choropleth scatter overlay
-million_dollar_flats_df = df_filtered.query("resale_price >= 1_000_000")[["resale_price", "town", "latitude", "longitude", "address", "flat_type"]].copy()
-million_dollar_flats_df["text"] = (million_dollar_flats_df["flat_type"].str.title() 
-                                    +  " flat at " 
-                                    +  million_dollar_flats_df["address"].astype(str).str.title() 
-                                    + ", sold for $" 
-                                    + million_dollar_flats_df["resale_price"].apply(lambda x: f"{x:,}"))
-# density heatmap
-density_heatmap_df = df_filtered[["town", "storey_range", "resale_price", "floor_area_sqm"]].copy()
-density_heatmap_df = density_heatmap_df.sort_values(by="storey_range", ascending=True)
-# resale transactions line chart
-resale_transactions_df = df_filtered.groupby("date").agg({"town": "count", "resale_price": "median"}).reset_index()
-index_benchmark = 400000 # price as of Jan 2020
-resale_transactions_df["price_index"] = resale_transactions_df["resale_price"] / index_benchmark * 100
-resale_transactions_df[["resale_price", "price_index"]] = resale_transactions_df[["resale_price", "price_index"]].round(0).astype("int32")
-
-def gen_median_map_plot():
-    ## choropleth
-    median_map_plot = px.choropleth_mapbox(
-        choropleth_df,
-        geojson=st.session_state.geo_df,
-        locations="town",
-        color="resale_price",
-        featureidkey="properties.PLN_AREA_N",
-        color_continuous_scale="burg",
-        center={"lat": 1.35, "lon": 103.80},
-        opacity=0.8,
-        hover_name="town",
-        hover_data={
-            "town": False,
-            "transactions": ":,",
-            "resale_price": ":,"
-        },
-        labels={"town": "Town", "transactions": "Transactions", "resale_price": "Median Resale Price"},
-    ).update_layout(
-        title={
-            "text": f"{year_option} Median Resale Price by Town",
-            "xanchor": "left",
-        },
-        height=600,
-        mapbox={
-            "accesstoken": st.secrets["mapbox_token"],
-            "style": "streets",
-            "zoom": 10,
-            "bounds": {"west": 103.5, "east": 104.2, "north": 1.55, "south": 1.15} # not working locally
-        },
-        coloraxis_colorbar={
-            "title": None,
-            "y": 0.5,
-            "yanchor": "middle",
-            "len": 1,
-            "ypad": 0,
-            "xpad": 0
-        }
-    )
-
-    median_map_plot.add_scattermapbox(
-        below="",
-        lat=million_dollar_flats_df["latitude"],
-        lon=million_dollar_flats_df["longitude"],
-        text=million_dollar_flats_df["text"],
-        mode="markers",
-        marker={"symbol": "star", "size": 5, "opacity": 0.9, "allowoverlap": True},
-        hovertemplate="<b>Million-Dollar Flat</b><br><br>"
-        + "%{text}"
-        + "<extra></extra>",
-        hoverlabel={
-            "bgcolor": "snow",
-            "font_color" : "black"
-        },
-    )
-
-    # Add buttons for control
-    median_map_plot.update_layout(
-        updatemenus=[
-            dict(
-                type = "buttons",
-                direction = "right",
-                buttons=list([
-                    dict(
-                        args=["mapbox_style", "streets"],
-                        label="Streets",
-                        method="relayout"
-                    ),
-                    dict(
-                        args=["mapbox_style", "dark"],
-                        label="Dark",
-                        method="relayout"
-                    )
-                ]),
-                pad={"r": 10, "t": 10},
-                showactive=True,
-                x=0.05,
-                xanchor="left",
-                y=-0.07,
-                yanchor="bottom",
-                visible=False # hide while buttons not working
-            ),
-            dict(
-                type = "buttons",
-                direction = "right",
-                buttons=list([
-                    dict(
-                        args=["color", "resale_price"],
-                        label="Median Price",
-                        method="restyle"
-                    ),
-                    dict(
-                        args=["color", "transactions"],
-                        label="Transactions",
-                        method="restyle"
-                    )
-                ]),
-                pad={"r": 10, "t": 10},
-                showactive=True,
-                x=0.05,
-                xanchor="left",
-                y=-0.14,
-                yanchor="bottom",
-                visible=False # hide while buttons not working
-            ),
-        ],
-        overwrite=True
-    )
-
-    # Add annotation
-    median_map_plot.update_layout(
-        annotations=[
-            dict(
-                text="Map style:", 
-                showarrow=False,
-                x=0, 
-                y=-0.06, 
-                yref="paper", 
-                align="left"),
-            dict(
-                text="Overlay:", 
-                showarrow=False,
-                x=0,
-                y=-0.13, 
-                yref="paper", 
-                align="left")
-        ],
-    )
-
-    return median_map_plot
-
-def gen_transaction_map_plot():
-    transaction_map_plot = px.choropleth_mapbox(
-        choropleth_df,
-        geojson=st.session_state.geo_df,
-        locations="town",
-        color="age",
-        featureidkey="properties.PLN_AREA_N",
-        color_continuous_scale="mint",
-        center={"lat": 1.35, "lon": 103.80},
-        opacity=0.8,
-        hover_name="town",
-        hover_data={
-            "town": False,
-            "age": True,
-            "resale_price": ":,",
-        },
-        labels={"town": "Town", "age": "Median Age", "resale_price": "Median Resale Price"},
-    ).update_layout(
-        title={
-            "text": f"{year_option} Median Age of Property at Transaction",
-            "x": 0.5,
-            "xanchor": "center",
-        },
-        height=600,
-        mapbox={
-            "accesstoken": st.secrets["mapbox_token"],
-            "style": "streets",
-            "zoom": 10,
-            "bounds": {"west": 103.5, "east": 104.2, "north": 1.55, "south": 1.15} # not working locally
-        },
-        coloraxis_colorbar={
-            "title": None,
-            "y": 0.5,
-            "yanchor": "middle",
-            "len": 1,
-            "ypad": 0,
-            "xpad": 0
-        }
-    )
-
-    return transaction_map_plot
-
-median_map_plot = gen_median_map_plot()
-transaction_map_plot = gen_transaction_map_plot()
-
-## line plots
-transactions_base = (
-    alt.Chart(resale_transactions_df, title="Total Transactions per Month")
-    .mark_line(
-        color="green"
-    )
-    .encode(
-        alt.X(
-            "date:T",
-            axis=alt.Axis(
-                formatType="time",
-                format="%b-%y",
-                title=None,
-                grid=False,
-                tickCount="month",
-            ),
-        ),
-        alt.Y(
-            "town:Q",
-            axis=alt.Axis(
-                title="Transactions",
-                formatType="number",
-            )
-        ),
-    )
-    .properties(
-        height=350,
-    )
+town_filter = None if town_option == "All Towns" else town_option
+year_filter = None if year_option == "All Years" else year_option
+# filtered rows, key metrics and roll-ups for the selection, from the dataset's indexes and cube
+views = aggregates.period_views(data, town_filter, year_filter, price_threshold, exact_medians)
+df_filtered = views.df_filtered
+metrics = views.metrics
+choropleth_df = views.choropleth_df
+million_dollar_flats_df = views.flats_df
+resale_transactions_df = views.resale_transactions_df
+threshold_label = f"S${numerize(price_threshold)}"
+
+# median figures also depend on whether exact medians were requested
+median_map_plot = figure_cache.get_or_build(
+    ("median_map", town_option, year_option, price_threshold, exact_medians, data.version),
+    lambda: charts.median_map(choropleth_df, million_dollar_flats_df, map_geo_df, year_option, threshold_label, st.secrets["mapbox_token"])
 )
-
-# creates selection that chooses the nearest point
-alt_nearest = alt.selection_single(
-    nearest=True, on="mouseover", fields=["date"], empty="none"
+transaction_map_plot = figure_cache.get_or_build(
+    ("transaction_map", town_option, year_option, exact_medians, data.version),
+    lambda: charts.transaction_map(choropleth_df, map_geo_df, year_option, st.secrets["mapbox_token"])
 )
 
-transactions_selector, transactions_rule = add_marker(transactions_base, alt_nearest, "town", "Resale Transactions", ",")
-transactions_plot = transactions_base + transactions_selector + transactions_rule
-
-price_index_base = (
-    alt.Chart(resale_transactions_df, title="Resale Price Index^")
-    .mark_line(
-        color="orange"
-    )
-    .encode(
-        alt.X(
-            "date:T",
-            axis=alt.Axis(
-                formatType="time",
-                format="%b-%y",
-                title="Transaction Period",
-                grid=False,
-                tickCount="month",
-            )
-        ),
-        alt.Y(
-            "price_index:Q", 
-            axis=alt.Axis(
-                title="Price Index",
-                grid=False
-            ),
-            scale=alt.Scale(domain=get_scale(resale_transactions_df["price_index"]))
-        )
-    )
-    .properties(
-        height=350,
-    )
-)
-
-price_index_selector, price_index_rule = add_marker(price_index_base, alt_nearest, "price_index", "Price Index", ",")
-price_index_plot = price_index_base + price_index_selector + price_index_rule
-
-median_price_base = (
-    alt.Chart(resale_transactions_df, title="Median Resale Price^ by Month")
-    .mark_line()
-    .encode(
-        alt.X(
-            "date:T",
-            axis=alt.Axis(
-                formatType="time",
-                format="%b-%y",
-                title="Transaction Period",
-                grid=False,
-                tickCount="month",
-            ),
-        ),
-        alt.Y(
-            "resale_price:Q",
-            axis=alt.Axis(
-                title="Resale Price (S$)", formatType="number", format="~s"
-            ),
-        ),
-    )
-    .properties(
-        height=350,
-    )
-)
+## line plots
+transactions_plot = charts.transactions_line(resale_transactions_df)
+price_index_plot = charts.price_index_line(resale_transactions_df)
+median_price_plot = charts.median_price_line(resale_transactions_df)
 
-median_price_selector, median_price_rule = add_marker(median_price_base, alt_nearest, "resale_price", "Median Resale Price", "$,")
-median_price_plot = median_price_base + median_price_selector + median_price_rule
-
-million_dollar_scatter = px.scatter(
-        df_filtered.query("resale_price >= 1_000_000"),
-        x="date",
-        y="resale_price",
-        color="floor_area_sqm",
-        title="address",
-        hover_name="address",
-        hover_data={
-            "date": "|%b %Y",
-            "resale_price": ":$,",
-        },
-        labels={
-            "date": "Transaction Date", "resale_price": "Resale Price", "floor_area_sqm": "Floor Area (sqm)"
-        }
-    ).update_layout(
-    title="Million Dollar Resale Transactions",
-    xaxis_title="Transaction Date",
-    yaxis_title="Resale Price (S$)",
-    height=350,
-    coloraxis_colorbar={
-        "title": "Floor Area (sqm)",
-        "y": 0.5,
-        "yanchor": "middle",
-        "len": 1,
-        "ypad": 0,
-        "xpad": 0
-    }
+million_dollar_scatter = figure_cache.get_or_build(
+    ("million_dollar_scatter", town_option, year_option, price_threshold, data.version),
+    lambda: charts.million_dollar_scatter(million_dollar_flats_df, threshold_label)
 )
-
-density_heatmap_plot = px.density_heatmap(
-    density_heatmap_df,
-    x="floor_area_sqm",
-    y="storey_range",
-    z="resale_price",
-    histfunc="avg",
-).update_layout(
-    title={
-        "text": f"Effects of Floor Area and Storey Range on Resale Price",
-        "xanchor": "left",
-    },
-    xaxis_title="Floor Area (sqm)",
-    yaxis_title="Storey Range",
-    height=400,
-    coloraxis_colorbar={
-        "title": "Average Resale Price",
-        "y": 0.5,
-        "yanchor": "middle",
-        "len": 1,
-        "ypad": 0,
-        "xpad": 0
-    }
+density_heatmap_plot = figure_cache.get_or_build(
+    ("density_heatmap", town_option, year_option, data.version),
+    lambda: charts.density_heatmap(df_filtered)
 )
 
 with st.container():
@@ -527,44 +175,45 @@ with st.container():
     met1, met2, met3 = st.columns(3)
     met1.metric(
         label="Total Resale Transactions",
-        value=f"{df_filtered['resale_price'].count():,}",
+        value=get_value("count", lambda n: f"{n:,}"),
         help="Total resale transactions during this period",
-        delta=get_delta("resale_price", "count")
+        delta=get_delta("count")
     )
     met2.metric(
         label="Total Transaction Value",
-        value=f'S${numerize(df_filtered["resale_price"].sum().item())}',
+        value=get_value("sum", lambda n: f"S${numerize(n)}"),
         help="Total value of all transactions during this period",
-        delta=get_delta("resale_price", "sum")
+        delta=get_delta("sum")
     )
     met3.metric(
-        label="Million Dollar Flats",
-        value=f"{million_dollar_flats_df['address'].count():,}",
-        help="Total Million Dollar Flats transacted during this period",
+        label=f"{threshold_label} Flats",
+        value=f"{len(million_dollar_flats_df):,}",
+        help=f"Total flats transacted at {threshold_label} or more during this period",
     )
     # row 2
     met4, met5, met6 = st.columns(3)
     met4.metric(
         label="Lowest Price",
-        value=f'S${df_filtered["resale_price"].min():,}',
+        value=get_value("min", lambda n: f"S${n:,}"),
         help="Lowest resale transaction price during this period",
-        delta=get_delta("resale_price", "min"),        
+        delta=get_delta("min"),        
         delta_color="inverse",
     )
     met5.metric(
         label="Highest Price",
-        value=f'S${numerize(df_filtered["resale_price"].max())}',
+        value=get_value("max", lambda n: f"S${numerize(n)}"),
         help="Highest resale transaction price during this period",
-        delta=get_delta("resale_price", "max"),
+        delta=get_delta("max"),
         delta_color="inverse",
     )
     met6.metric(
         label="Median Price",
-        value=f'S${int(df_filtered["resale_price"].median()):,}',
+        value=get_value("median", lambda n: f"S${int(n):,}"),
         help="Median price of all transactions during this period",
-        delta=get_delta("resale_price", "median"),
+        delta=get_delta("median"),
         delta_color="inverse",
     )
+    st.caption(f"Key metrics computed in {metrics['seconds'] * 1000:,.1f} ms")
 
 st.markdown("---")
 
@@ -584,7 +233,7 @@ with row1_tab1:
         A choropleth map based on the boundary lines provided by the URA 2014 Master Plan Planning Areas. 
         
         - The planning areas are coloured based on the median resale price in each area during the selected time period.
-        - Stars on the map represent transactions that have crossed the coveted S$1 million threshold.
+        - Stars on the map represent transactions that have crossed the price threshold in the side bar, the coveted S$1 million by default.
         - Toggle between Median Price or Transactions count overlay with the buttons below the map. (WIP)
         """
     )
@@ -602,18 +251,11 @@ with row1_tab2:
 
 with st.container():
     st.altair_chart(transactions_plot,use_container_width=True)
-    row2_tab1, row2_tab2, row2_tab3 = st.tabs(["Resale Price Index", "Median Resale Price", "Million Dollar Transactions"])
+    row2_tab1, row2_tab2, row2_tab3 = st.tabs(["Resale Price Index", "Median Resale Price", f"{threshold_label} Transactions"])
     st.markdown("---")
 
 with row2_tab1:
-    # show line at price index = 100
-    if resale_transactions_df.price_index.min() <= 100 and resale_transactions_df.price_index.max() >= 100:
-        resale_price_index_line = alt.Chart(
-            resale_transactions_df).mark_rule(color="gray", strokeDash=[4, 4], strokeOpacity=0.1).encode(y=alt.datum(100)
-            )
-        st.altair_chart(price_index_plot + resale_price_index_line,use_container_width=True)
-    else:
-        st.altair_chart(price_index_plot,use_container_width=True)
+    st.altair_chart(price_index_plot,use_container_width=True)
     st.markdown("^ Base period is taken at Jan 2020 ($400k) across all towns and flat types, with index at 100")
 
 with row2_tab2:
@@ -625,4 +267,9 @@ with row2_tab3:
 
 with st.container():
     st.plotly_chart(density_heatmap_plot, use_container_width=True)
+    cache_stats = figure_cache.stats()
+    st.caption(
+        f"Figure cache: {cache_stats['hits']:,} hits, {cache_stats['misses']:,} misses, "
+        f"{cache_stats['entries']:,} figures in {cache_stats['bytes'] / 1e6:,.1f} MB"
+    )
     st.markdown("---")
\ No newline at end of file
@@ -0,0 +1,219 @@
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import synthetic
+
+"""
+Offline stand-in for the Data.gov.sg datastore_search endpoint.
+
+Serves recorded or synthetic resale records with limit/offset/sort paging, and can inject
+latency and failures so the fetch layer can be benchmarked and exercised without network.
+
+    python replay_server.py serve --rows 200000 --latency 0.05 --failure-rate 0.1
+    HDB_API_URL=http://127.0.0.1:8765/api/action/datastore_search streamlit run Home.py
+
+    python replay_server.py record --out fixtures.jsonl --limit 5000
+"""
+
+
+def synthetic_records(rows: int, seed: int = 0, start_year: int = 2017, end_year: int = 2023) -> list:
+    """
+    Records shaped like the live resource, from the synthetic transaction generator.
+    The live resource starts in 2017, pass an earlier `start_year` to include older history.
+    """
+    return synthetic.to_records(synthetic.generate(rows, seed, start_year, end_year))
+
+
+def load_fixture(fixture_path: str) -> list:
+    with open(fixture_path) as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def parse_sort(sort: str) -> list:
+    """
+    "month desc,_id desc" -> [("month", True), ("_id", True)]
+    """
+    keys = []
+    for part in sort.split(","):
+        field, _, direction = part.strip().partition(" ")
+        keys.append((field, direction.strip().lower() == "desc"))
+    return keys
+
+
+class ReplayState:
+    """
+    Records served by the replay handler, with injected faults and request counters.
+    """
+
+    def __init__(self, records: list, latency: float = 0, jitter: float = 0, failure_rate: float = 0,
+                 truncate_rate: float = 0, retry_after: int = None, seed: int = 0):
+        self.records = records
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.truncate_rate = truncate_rate
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.sorted = {}
+        self.etag = '"' + hashlib.sha1(json.dumps(records[-1:]).encode() + str(len(records)).encode()).hexdigest() + '"'
+        self.stats = {"requests": 0, "not_modified": 0, "failures": 0, "truncated": 0, "records_served": 0}
+
+    def count(self, key: str, n: int = 1):
+        with self.lock:
+            self.stats[key] += n
+
+    def roll(self, rate: float) -> bool:
+        with self.lock:
+            return self.rng.random() < rate
+
+    def get_sorted(self, sort: str) -> list:
+        with self.lock:
+            if sort not in self.sorted:
+                records = self.records
+                # stable sorts applied from the last key to the first give a multi-key ordering
+                for field, descending in reversed(parse_sort(sort)):
+                    records = sorted(records, key=lambda record: record[field], reverse=descending)
+                self.sorted[sort] = records
+            return self.sorted[sort]
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    state = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status: int, body: dict, truncate: bool = False):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.send_header("ETag", self.state.etag)
+        self.end_headers()
+        self.wfile.write(payload[: len(payload) // 2] if truncate else payload)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/stats":
+            return self.send_json(200, self.state.stats)
+        if not url.path.endswith("/datastore_search"):
+            return self.send_json(404, {"success": False, "error": {"message": "Not found"}})
+
+        state = self.state
+        state.count("requests")
+        time.sleep(max(0, state.latency + state.rng.uniform(-state.jitter, state.jitter)))
+
+        if state.roll(state.failure_rate):
+            state.count("failures")
+            status = 429 if state.roll(0.5) else 503
+            self.send_response(status)
+            if status == 429 and state.retry_after is not None:
+                self.send_header("Retry-After", str(state.retry_after))
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if self.headers.get("If-None-Match") == state.etag:
+            state.count("not_modified")
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        query = parse_qs(url.query)
+        limit = int(query.get("limit", ["100"])[0])
+        offset = int(query.get("offset", ["0"])[0])
+        resource_id = query.get("resource_id", [""])[0]
+        records = state.get_sorted(query["sort"][0]) if "sort" in query else state.records
+        page = records[offset:offset + limit]
+        state.count("records_served", len(page))
+        truncate = state.roll(state.truncate_rate)
+        if truncate:
+            state.count("truncated")
+        self.send_json(200, {
+            "help": "",
+            "success": True,
+            "result": {
+                "resource_id": resource_id,
+                "fields": [{"id": field, "type": "text"} for field in (records[0] if records else {})],
+                "records": page,
+                "_links": {"start": url.path, "next": f"{url.path}?offset={offset + limit}"},
+                "limit": limit,
+                "offset": offset,
+                "total": len(records),
+            },
+        }, truncate=truncate)
+
+
+def serve(state: ReplayState, host: str = "127.0.0.1", port: int = 8765) -> ThreadingHTTPServer:
+    """
+    Start the replay server on a background thread and return it; call shutdown() when done.
+    """
+    handler = type("BoundReplayHandler", (ReplayHandler,), {"state": state})
+    server = ThreadingHTTPServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def record(out_path: str, limit: int):
+    """
+    Save the first `limit` records of each resource exactly as the API returns them, text
+    values and all, so replays go through the same parsing as live responses.
+    """
+    import fetch as f
+
+    records = []
+    for resource_id in f.resource_ids:
+        params = {"resource_id": resource_id, "limit": limit}
+        with f.get_session().get(f.api_url, params=params, timeout=60) as r:
+            r.raise_for_status()
+            records.extend(r.json()["result"]["records"])
+    with open(out_path, "w") as file:
+        for item in records:
+            file.write(json.dumps(item) + "\n")
+    print(f"Recorded {len(records):,} records to {out_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline datastore_search replay server")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = commands.add_parser("serve")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8765)
+    serve_parser.add_argument("--fixture", help="JSON lines file of recorded records")
+    serve_parser.add_argument("--rows", type=int, default=10_000, help="synthetic records when no fixture is given")
+    serve_parser.add_argument("--seed", type=int, default=0)
+    serve_parser.add_argument("--start-year", type=int, default=2017, help="first year of synthetic records")
+    serve_parser.add_argument("--latency", type=float, default=0, help="seconds added to every response")
+    serve_parser.add_argument("--jitter", type=float, default=0, help="+/- seconds of random latency")
+    serve_parser.add_argument("--failure-rate", type=float, default=0, help="fraction of 429/503 responses")
+    serve_parser.add_argument("--truncate-rate", type=float, default=0, help="fraction of bodies cut in half")
+    serve_parser.add_argument("--retry-after", type=int, help="Retry-After seconds sent with 429s")
+
+    record_parser = commands.add_parser("record")
+    record_parser.add_argument("--out", required=True)
+    record_parser.add_argument("--limit", type=int, default=5_000)
+
+    args = parser.parse_args()
+    if args.command == "record":
+        return record(args.out, args.limit)
+
+    records = load_fixture(args.fixture) if args.fixture else synthetic_records(args.rows, args.seed, args.start_year)
+    state = ReplayState(records, args.latency, args.jitter, args.failure_rate, args.truncate_rate, args.retry_after, args.seed)
+    server = serve(state, args.host, args.port)
+    print(f"Serving {len(records):,} records at http://{args.host}:{server.server_port}/api/action/datastore_search")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+        print(json.dumps(state.stats))
+
+
+if __name__ == "__main__":
+    main()
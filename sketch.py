@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+
+"""
+Mergeable quantile sketches for resale prices, stored as long (cell, value, count) tables.
+
+Prices are counted in logarithmic buckets, bucket i covering (gamma^(i-1), gamma^i] with
+gamma = (1 + alpha) / (1 - alpha), in the style of DDSketch. Merging sketches is a sum of
+bucket counts, so any set of cells can be combined without revisiting the transactions.
+
+Error bound: a quantile read from a merged sketch is the representative value of the bucket
+holding that rank, which is within a relative error of `alpha` of the exact value at that rank.
+Medians of even-sized groups average the two middle ranks and stay within the same bound.
+With the default alpha of 1%, a S$500,000 median is reported to within S$5,000.
+"""
+
+alpha = 0.01
+gamma = (1 + alpha) / (1 - alpha)
+
+
+def to_bucket(values) -> np.ndarray:
+    return np.ceil(np.log(np.asarray(values, dtype=float)) / np.log(gamma)).astype("int16")
+
+
+def bucket_value(buckets) -> np.ndarray:
+    """
+    Representative value of a bucket, within alpha of every value counted in it.
+    """
+    return 2 * gamma ** np.asarray(buckets, dtype=float) / (gamma + 1)
+
+
+def count_values(cell_ids: np.ndarray, values: np.ndarray) -> pd.DataFrame:
+    """
+    Long (cell, value, count) table of how often each value occurs in each cell,
+    sorted by cell and value.
+    """
+    counts = (
+        pd.DataFrame({"cell": cell_ids, "value": values})
+        .value_counts(sort=False)
+        .reset_index(name="count")
+        .sort_values(["cell", "value"], ignore_index=True)
+    )
+    return counts.astype({"cell": "int32", "count": "int32"})
+
+
+def build_sketches(cell_ids: np.ndarray, values) -> pd.DataFrame:
+    return count_values(cell_ids, to_bucket(values))
+
+
+def grouped_quantile(counts: pd.DataFrame, cell_groups: np.ndarray, n_groups: int, q: float = 0.5, to_value=None) -> np.ndarray:
+    """
+    Quantile per group after merging the (cell, value, count) tables of each group's cells.
+
+    cell_groups maps each cell to a group, or -1 to leave it out. Values are mapped through
+    `to_value` (e.g. bucket_value for sketches) before being returned. When the quantile falls
+    between two ranks the two values are interpolated linearly, as pandas does.
+    """
+    if to_value is None:
+        to_value = lambda v: v.astype(float)
+    groups = cell_groups[counts["cell"].to_numpy()]
+    keep = groups >= 0
+    groups = groups[keep]
+    values = counts["value"].to_numpy()[keep]
+    weights = counts["count"].to_numpy()[keep]
+    order = np.lexsort((values, groups))
+    groups, values, weights = groups[order], values[order], weights[order]
+
+    totals = np.bincount(groups, weights=weights, minlength=n_groups).astype("int64")
+    offsets = np.concatenate([[0], np.cumsum(totals)[:-1]])
+    cumulative = np.cumsum(weights, dtype="int64")
+    result = np.full(n_groups, np.nan)
+    present = totals > 0
+    rank = q * (totals[present] - 1)
+    lower_rank = np.floor(rank).astype("int64")
+    fraction = rank - lower_rank
+    upper_rank = np.minimum(lower_rank + 1, totals[present] - 1)
+    lower = to_value(values[np.searchsorted(cumulative, offsets[present] + lower_rank, side="right")])
+    upper = to_value(values[np.searchsorted(cumulative, offsets[present] + upper_rank, side="right")])
+    result[present] = lower + (upper - lower) * fraction
+    return result
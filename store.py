@@ -0,0 +1,182 @@
+import hashlib
+import json
+import os
+import pandas as pd
+from pandas.api.types import union_categoricals
+import fetch as f
+
+"""
+Local snapshot of the raw resale records, stored as one Parquet partition per year.
+
+A manifest alongside the partitions records the row count, latest month and checksum
+of each partition, so the refresh watermark can be found without reading any data.
+"""
+
+path = os.path.dirname(__file__)
+snapshot_dir = os.path.join(path, "assets", "snapshot")
+legacy_path = os.path.join(path, "assets", "dataset.parquet")
+
+
+def partition_path(year: str, directory: str = snapshot_dir) -> str:
+    return os.path.join(directory, f"year={year}.parquet")
+
+
+def file_checksum(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def read_manifest(directory: str = snapshot_dir) -> dict:
+    file_path = os.path.join(directory, "manifest.json")
+    if not os.path.exists(file_path):
+        return {"partitions": {}}
+    with open(file_path) as file:
+        return json.load(file)
+
+
+def write_manifest(manifest: dict, directory: str = snapshot_dir):
+    file_path = os.path.join(directory, "manifest.json")
+    tmp_path = f"{file_path}.tmp-{os.getpid()}"
+    with open(tmp_path, "w") as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+    os.replace(tmp_path, file_path)
+
+
+def write_partition(year: str, df: pd.DataFrame, staged: bool = False, directory: str = snapshot_dir) -> dict:
+    """
+    Write a single year partition to a temporary file and rename it into place,
+    so readers never see a half-written partition.
+
+    A `staged` partition is left under its temporary name, recorded in the returned entry,
+    until `commit_snapshot` moves it into place.
+    """
+    file_path = partition_path(year, directory)
+    tmp_path = f"{file_path}.{'staged' if staged else 'tmp'}-{os.getpid()}"
+    # older snapshots hold numeric fields as text, keep partitions on one schema
+    df = df.assign(**{field: pd.to_numeric(df[field]) for field in f.numeric_fields if field in df})
+    df.to_parquet(tmp_path, index=False)
+    entry = {
+        "file": os.path.basename(file_path),
+        "rows": int(df.shape[0]),
+        "latest_month": df["month"].max(),
+        "sha256": file_checksum(tmp_path),
+    }
+    if staged:
+        entry["staged"] = os.path.basename(tmp_path)
+    else:
+        os.replace(tmp_path, file_path)
+    return entry
+
+
+def write_partitions(df: pd.DataFrame, manifest: dict = None, staged: bool = False) -> dict:
+    os.makedirs(snapshot_dir, exist_ok=True)
+    if manifest is None:
+        manifest = read_manifest()
+    for year, partition in df.groupby(df["month"].str[:4]):
+        manifest["partitions"][year] = write_partition(year, partition.reset_index(drop=True), staged)
+        print(f"Snapshot partition {year} {'staged' if staged else 'written'}, {partition.shape[0]:,} rows")
+    if not staged:
+        write_manifest(manifest)
+    return manifest
+
+
+def migrate_legacy():
+    """
+    Split the old single-file assets/dataset.parquet into year partitions.
+    """
+    if read_manifest()["partitions"] or not os.path.exists(legacy_path):
+        return
+    print("Migrating assets/dataset.parquet into year partitions")
+    write_partitions(pd.read_parquet(legacy_path))
+
+
+def get_watermark() -> str:
+    """
+    Latest transaction month ("YYYY-MM") held in the snapshot, taken from the manifest.
+    """
+    partitions = read_manifest()["partitions"]
+    if not partitions:
+        return None
+    return max(partition["latest_month"] for partition in partitions.values())
+
+
+def stage_snapshot(df_new: pd.DataFrame, watermark: str = None) -> dict:
+    """
+    Merge newly fetched records with the snapshot, writing only the years they touch, as
+    staged partitions the snapshot does not include yet. Returns the manifest the snapshot
+    would have, to read the merged records with `read_snapshot` and later to pass to
+    `commit_snapshot` or `discard_snapshot`.
+
+    Stored rows from the watermark month onwards are replaced by the new records,
+    since the watermark month is always fetched again in full. Merged partitions are sorted
+    by month and _id, as the API returns records newest first, so fetching the same records
+    again writes the same bytes and keeps the dataset version.
+    """
+    manifest = read_manifest()
+    merged = []
+    for year, partition in df_new.groupby(df_new["month"].str[:4]):
+        if year in manifest["partitions"]:
+            stored = pd.read_parquet(partition_path(year))
+            if watermark is not None:
+                stored = stored[stored["month"] < watermark]
+            partition = pd.concat([stored, partition], axis=0, ignore_index=True)
+        merged.append(partition)
+    if merged:
+        merged = pd.concat(merged, axis=0, ignore_index=True).sort_values(["month", "_id"], kind="stable", ignore_index=True)
+        write_partitions(merged, manifest, staged=True)
+    return manifest
+
+
+def commit_snapshot(manifest: dict):
+    """
+    Move the staged partitions of `manifest` into place and make it the snapshot manifest.
+    """
+    partitions = {}
+    for year, entry in manifest["partitions"].items():
+        entry = dict(entry)
+        if "staged" in entry:
+            os.replace(os.path.join(snapshot_dir, entry.pop("staged")), partition_path(year))
+        partitions[year] = entry
+    if partitions != read_manifest()["partitions"]:
+        write_manifest(dict(manifest, partitions=partitions))
+
+
+def discard_snapshot(manifest: dict):
+    for entry in manifest["partitions"].values():
+        if "staged" in entry:
+            try:
+                os.remove(os.path.join(snapshot_dir, entry["staged"]))
+            except FileNotFoundError:
+                pass
+
+
+def read_snapshot(years: list = None, columns: list = None, categories: list = None, verify: bool = False, manifest: dict = None, directory: str = snapshot_dir) -> pd.DataFrame:
+    """
+    Load the requested year partitions (all by default), reading only the requested columns.
+    Text columns listed in `categories` are decoded straight from the Parquet dictionaries
+    into categoricals, with categories unified across partitions.
+
+    A `manifest` from `stage_snapshot` reads its staged partitions in place of the stored ones.
+    `directory` reads another snapshot, such as a synthetic one, in place of the local snapshot.
+    """
+    partitions = (manifest or read_manifest(directory))["partitions"]
+    if years is not None:
+        years = {str(year) for year in years}
+        partitions = {year: meta for year, meta in partitions.items() if year in years}
+    frames = []
+    for year in sorted(partitions):
+        file_path = os.path.join(directory, partitions[year]["staged"]) if "staged" in partitions[year] else partition_path(year, directory)
+        if verify and file_checksum(file_path) != partitions[year]["sha256"]:
+            raise ValueError(f"Checksum mismatch for snapshot partition {year}")
+        frames.append(pd.read_parquet(file_path, columns=columns, read_dictionary=categories))
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    for column in categories or []:
+        # concat only keeps categoricals whose categories match exactly
+        unified = union_categoricals([frame[column] for frame in frames], sort_categories=True).categories
+        for frame in frames:
+            frame[column] = frame[column].cat.set_categories(unified)
+    return pd.concat(frames, axis=0, ignore_index=True)
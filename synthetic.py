@@ -0,0 +1,266 @@
+import argparse
+import os
+import time
+import numpy as np
+import pandas as pd
+import fetch as f
+import geo
+import store
+
+"""
+Synthetic resale transactions for testing the dashboard beyond the size of the real dataset.
+
+Transactions are drawn over the real addresses in hdb_coords.csv, each address given a
+town from the planning area it falls in, a lease commencement year typical of that town's
+development and a block height typical of its era. Flat types, models and floor areas
+follow the block's era, transaction volumes and prices follow the resale market year by
+year, and prices fall off with distance from the city centre and remaining lease.
+
+Rows have the columns of the Data.gov.sg resale records, with the text columns as
+categoricals and the numeric fields as numbers, as the fetch layer returns them. Rows are
+generated a year at a time with NumPy, so tens of millions of rows only ever hold a year
+in memory when written to a snapshot. Synthetic snapshots go to assets/synthetic, apart
+from the local snapshot of real data and its fetch state, and are read from there with
+`store.read_snapshot(directory=...)`.
+
+    python synthetic.py snapshot --rows 10000000 --start-year 1990
+"""
+
+synthetic_dir = os.path.join(os.path.dirname(__file__), "assets", "synthetic")
+columns = [
+    "_id", "month", "town", "flat_type", "block", "street_name", "storey_range",
+    "floor_area_sqm", "flat_model", "lease_commence_date", "remaining_lease", "resale_price",
+]
+
+# year: (resale transactions in thousands, resale price index), approximating the HDB series
+market = {
+    1990: (20, 24), 1991: (23, 26), 1992: (28, 30), 1993: (30, 40), 1994: (34, 50),
+    1995: (28, 65), 1996: (30, 85), 1997: (46, 85), 1998: (50, 72), 1999: (70, 72),
+    2000: (60, 77), 2001: (45, 73), 2002: (30, 72), 2003: (26, 72), 2004: (26, 72),
+    2005: (28, 72), 2006: (27, 74), 2007: (30, 85), 2008: (29, 97), 2009: (32, 103),
+    2010: (30, 118), 2011: (25, 131), 2012: (22, 142), 2013: (17, 147), 2014: (16, 138),
+    2015: (18, 136), 2016: (20, 135), 2017: (20, 133), 2018: (22, 131), 2019: (22, 130),
+    2020: (23, 133), 2021: (29, 150), 2022: (27, 166), 2023: (26, 174),
+}
+# price per sqm before location, lease and storey adjustments, at a price index of 100
+base_price_per_sqm = 3_900
+city_centre = (1.2840, 103.8510)
+
+# planning areas whose flats are recorded under a differently named HDB town
+hdb_towns = {
+    "Kallang": "KALLANG/WHAMPOA",
+    "Novena": "KALLANG/WHAMPOA",
+    "Downtown Core": "CENTRAL AREA",
+    "Outram": "CENTRAL AREA",
+    "Rochor": "CENTRAL AREA",
+    "Changi": "PASIR RIS",
+    "Tanglin": "BUKIT TIMAH",
+}
+# typical lease commencement year of each town's blocks
+town_lease_years = {
+    "ANG MO KIO": 1978, "BEDOK": 1980, "BISHAN": 1988, "BUKIT BATOK": 1986, "BUKIT MERAH": 1978,
+    "BUKIT PANJANG": 1995, "BUKIT TIMAH": 1980, "CENTRAL AREA": 1978, "CHOA CHU KANG": 1994,
+    "CLEMENTI": 1980, "GEYLANG": 1978, "HOUGANG": 1990, "JURONG EAST": 1985, "JURONG WEST": 1995,
+    "KALLANG/WHAMPOA": 1978, "MARINE PARADE": 1976, "PASIR RIS": 1994, "PUNGGOL": 2010,
+    "QUEENSTOWN": 1975, "SEMBAWANG": 2000, "SENGKANG": 2004, "SERANGOON": 1987, "TAMPINES": 1990,
+    "TOA PAYOH": 1975, "WOODLANDS": 1995, "YISHUN": 1988,
+}
+# block eras: leases commencing before 1980, from 1980 to 1995, and from 1996
+era_starts = [1980, 1996]
+
+flat_types = ["1 ROOM", "2 ROOM", "3 ROOM", "4 ROOM", "5 ROOM", "EXECUTIVE", "MULTI-GENERATION"]
+flat_type_shares = np.array([
+    [0.02, 0.04, 0.55, 0.25, 0.11, 0.03, 0.0],
+    [0.0, 0.01, 0.20, 0.40, 0.27, 0.115, 0.005],
+    [0.0, 0.04, 0.14, 0.47, 0.33, 0.02, 0.0],
+])
+# mean and standard deviation of floor area by flat type, in sqm
+floor_areas = np.array([[31, 2], [45, 4], [68, 6], [95, 6], [118, 7], [145, 8], [160, 5]])
+# larger flats sell for less per sqm
+flat_type_premiums = np.array([1.10, 1.05, 1.0, 0.97, 0.94, 0.88, 0.85])
+
+flat_models = [
+    "Improved", "New Generation", "Simplified", "Standard", "Model A", "Premium Apartment", "DBSS",
+    "Apartment", "Maisonette", "Multi Generation",
+]
+flat_model_shares = np.array([
+    [0.35, 0.40, 0.05, 0.20, 0.0, 0.0, 0.0],
+    [0.15, 0.05, 0.25, 0.0, 0.55, 0.0, 0.0],
+    [0.05, 0.0, 0.0, 0.0, 0.50, 0.40, 0.05],
+])
+
+max_storeys = 51
+storey_ranges = [f"{start:02d} TO {start + 2:02d}" for start in range(1, max_storeys, 3)]
+
+
+def sample(rng: np.random.Generator, shares: np.ndarray, rows: np.ndarray) -> np.ndarray:
+    """
+    Draw one category code per row, from the row of `shares` that `rows` selects.
+    """
+    cumulative = shares.cumsum(axis=1)
+    cumulative /= cumulative[:, -1:]
+    return (rng.random(len(rows))[:, None] > cumulative[rows]).sum(axis=1)
+
+
+def load_blocks(rng: np.random.Generator) -> pd.DataFrame:
+    """
+    One row per address in hdb_coords.csv with its town, distance from the city centre,
+    and a drawn lease commencement year and height.
+    """
+    hdb_coordinates = f.get_coords_df()
+    hdb_coordinates = hdb_coordinates[~hdb_coordinates.index.duplicated()]
+    planning_areas, polygons = geo.get_planning_areas(f.get_chloropeth())
+    town_lookup = geo.get_town_lookup(hdb_coordinates, planning_areas, polygons)
+    blocks = hdb_coordinates[["latitude", "longitude"]].assign(town=town_lookup).dropna()
+    blocks["town"] = blocks["town"].map(lambda area: hdb_towns.get(area, area.upper()))
+    blocks[["block", "street_name"]] = blocks.index.to_series().str.split(" ", n=1, expand=True)
+
+    north = (blocks["latitude"] - city_centre[0]) * 110.57
+    east = (blocks["longitude"] - city_centre[1]) * 111.32 * np.cos(np.radians(city_centre[0]))
+    blocks["distance"] = np.hypot(north, east)
+    typical_years = blocks["town"].map(town_lease_years).fillna(1985).to_numpy()
+    blocks["lease_commence_date"] = np.clip(np.round(rng.normal(typical_years, 7)), 1966, 2019).astype("int16")
+    # newer blocks are taller
+    typical_storeys = 8 + 0.4 * (blocks["lease_commence_date"] - 1966)
+    blocks["storeys"] = np.clip(np.round(rng.normal(typical_storeys, 4)), 3, max_storeys).astype("int16")
+    blocks["era"] = np.digitize(blocks["lease_commence_date"], era_starts)
+    return blocks.reset_index(drop=True)
+
+
+def generate_year(blocks: pd.DataFrame, categories: dict, year: int, rows: int, rng: np.random.Generator) -> pd.DataFrame:
+    """
+    `rows` transactions in `year`, over blocks past their five-year minimum occupation period.
+    Taller blocks have more flats and so more transactions.
+    """
+    lease_years = blocks["lease_commence_date"].to_numpy()
+    weights = np.where(lease_years + 5 <= year, blocks["storeys"].to_numpy(), 0).astype("float64")
+    if not weights.any():
+        weights = blocks["storeys"].to_numpy().astype("float64")
+    block = rng.choice(len(blocks), size=rows, p=weights / weights.sum())
+
+    era = blocks["era"].to_numpy()[block]
+    flat_type = sample(rng, flat_type_shares, era)
+    flat_model = sample(rng, flat_model_shares, era)
+    flat_model = np.where(flat_type == flat_types.index("1 ROOM"), flat_models.index("Improved"), flat_model)
+    executive = np.where(rng.random(rows) < 0.6, flat_models.index("Apartment"), flat_models.index("Maisonette"))
+    flat_model = np.where(flat_type == flat_types.index("EXECUTIVE"), executive, flat_model)
+    flat_model = np.where(flat_type == flat_types.index("MULTI-GENERATION"), flat_models.index("Multi Generation"), flat_model)
+    floor_area_sqm = np.maximum(np.round(rng.normal(floor_areas[flat_type, 0], floor_areas[flat_type, 1])), 28)
+
+    storey = 1 + (rng.random(rows) * blocks["storeys"].to_numpy()[block]).astype("int64")
+    month = np.sort(rng.integers(1, 13, rows))
+    lease_commence_date = lease_years[block]
+    remaining_months = np.clip((lease_commence_date.astype("int64") + 99 - year) * 12 - (month - 1), 0, 99 * 12)
+
+    price_per_sqm = (
+        base_price_per_sqm * market[year][1] / 100
+        * 1.35 * np.exp(-0.025 * blocks["distance"].to_numpy()[block])
+        * (remaining_months / (99 * 12)) ** 0.4
+        * (1 + 0.012 * storey)
+        * flat_type_premiums[flat_type]
+        * rng.lognormal(0, 0.1, rows)
+    )
+    return pd.DataFrame({
+        "month": pd.Categorical.from_codes((year - categories["first_year"]) * 12 + month - 1, dtype=categories["month"]),
+        "town": blocks["town"].array.take(block),
+        "flat_type": pd.Categorical.from_codes(flat_type, dtype=categories["flat_type"]),
+        "block": blocks["block"].array.take(block),
+        "street_name": blocks["street_name"].array.take(block),
+        "storey_range": pd.Categorical.from_codes((storey - 1) // 3, dtype=categories["storey_range"]),
+        "floor_area_sqm": floor_area_sqm,
+        "flat_model": pd.Categorical.from_codes(flat_model, dtype=categories["flat_model"]),
+        "lease_commence_date": lease_commence_date.astype("float64"),
+        "remaining_lease": pd.Categorical.from_codes(remaining_months, dtype=categories["remaining_lease"]),
+        "resale_price": np.maximum(np.round(price_per_sqm * floor_area_sqm, -3), 5_000),
+    })
+
+
+def generate_years(rows: int, seed: int = 0, start_year: int = 1990, end_year: int = 2023):
+    """
+    Yield (year, transactions) for each year from `start_year` to `end_year`, `rows` in total,
+    split between the years in proportion to their resale volumes.
+    """
+    if start_year not in market or end_year not in market or start_year > end_year:
+        raise ValueError(f"Years must be between {min(market)} and {max(market)}")
+    rng = np.random.default_rng(seed)
+    blocks = load_blocks(rng)
+    years = list(range(start_year, end_year + 1))
+    volumes = np.array([market[year][0] for year in years], dtype="float64")
+    year_rows = rng.multinomial(rows, volumes / volumes.sum())
+
+    # shared categories, so years concatenate and partitions read back without recoding
+    blocks["town"] = blocks["town"].astype("category")
+    blocks["block"] = blocks["block"].astype("category")
+    blocks["street_name"] = blocks["street_name"].astype("category")
+    categories = {
+        "first_year": start_year,
+        "month": pd.CategoricalDtype([f"{year}-{month:02d}" for year in years for month in range(1, 13)], ordered=True),
+        "flat_type": pd.CategoricalDtype(flat_types),
+        "storey_range": pd.CategoricalDtype(storey_ranges),
+        "flat_model": pd.CategoricalDtype(flat_models),
+        "remaining_lease": pd.CategoricalDtype([f"{months // 12} years {months % 12:02d} months" for months in range(99 * 12 + 1)]),
+    }
+    next_id = 1
+    for year, n in zip(years, year_rows):
+        df = generate_year(blocks, categories, year, int(n), rng)
+        df.insert(0, "_id", np.arange(next_id, next_id + n, dtype="float64"))
+        next_id += n
+        yield year, df
+
+
+def generate(rows: int, seed: int = 0, start_year: int = 1990, end_year: int = 2023) -> pd.DataFrame:
+    """
+    `rows` synthetic transactions from `start_year` to `end_year`, in date order.
+    """
+    frames = [df for _, df in generate_years(rows, seed, start_year, end_year)]
+    return pd.concat(frames, ignore_index=True)[columns]
+
+
+def to_records(df: pd.DataFrame) -> list:
+    """
+    Records as the datastore_search API returns them, with every value but _id as text.
+    """
+    text = df[columns].assign(
+        _id=df["_id"].astype("int64"),
+        floor_area_sqm=df["floor_area_sqm"].astype("int64").astype(str),
+        lease_commence_date=df["lease_commence_date"].astype("int64").astype(str),
+        resale_price=df["resale_price"].astype(str),
+    )
+    return text.astype({column: str for column in columns if column != "_id"}).to_dict("records")
+
+
+def write_snapshot(rows: int, seed: int = 0, start_year: int = 1990, end_year: int = 2023, directory: str = synthetic_dir) -> dict:
+    """
+    Write a snapshot of synthetic transactions to `directory`, one year partition at a time,
+    replacing any synthetic snapshot already there. The local snapshot is never written to.
+    """
+    if os.path.realpath(directory) == os.path.realpath(store.snapshot_dir):
+        raise ValueError(f"Refusing to overwrite the local snapshot at {store.snapshot_dir}")
+    os.makedirs(directory, exist_ok=True)
+    manifest = {"partitions": {}}
+    for year, df in generate_years(rows, seed, start_year, end_year):
+        manifest["partitions"][str(year)] = store.write_partition(str(year), df, directory=directory)
+        print(f"Snapshot partition {year} written, {df.shape[0]:,} rows")
+    store.write_manifest(manifest, directory)
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetic resale transactions")
+    commands = parser.add_subparsers(dest="command", required=True)
+    snapshot_parser = commands.add_parser("snapshot", help="write a snapshot of synthetic transactions")
+    snapshot_parser.add_argument("--rows", type=int, default=1_000_000)
+    snapshot_parser.add_argument("--seed", type=int, default=0)
+    snapshot_parser.add_argument("--start-year", type=int, default=1990)
+    snapshot_parser.add_argument("--end-year", type=int, default=2023)
+    snapshot_parser.add_argument("--out", default=synthetic_dir, help="snapshot directory, assets/synthetic by default")
+    args = parser.parse_args()
+
+    if args.command == "snapshot":
+        start = time.perf_counter()
+        write_snapshot(args.rows, args.seed, args.start_year, args.end_year, args.out)
+        print(f"Wrote {args.rows:,} synthetic transactions in {time.perf_counter() - start:,.1f}s")
+
+
+if __name__ == "__main__":
+    main()